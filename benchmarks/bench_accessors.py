@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of Message.get() compared with walking the field path on
+each call as it was done before compiled accessors.
+
+Lookups made while processing the container-image and redhat-advisory
+fixtures are recorded and then replayed with both implementations.
+
+Run from the repository root:
+
+    python benchmarks/bench_accessors.py [--rounds N]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from resultsdbupdater import exceptions, utils  # noqa: E402
+from resultsdbupdater.consumer import handle_message  # noqa: E402
+from resultsdbupdater.message import REQUIRED_FIELD, Message, create_message  # noqa: E402
+
+FIXTURES = (
+    'redhat-container-image.test.complete',
+    'redhat-advisory.test.complete',
+    'redhat-advisory.test.error',
+)
+
+
+def _legacy_get(*args, **kwargs):
+    value = kwargs.get('value')
+    default = kwargs.get('default')
+
+    for arg in args:
+        if not isinstance(value, dict):
+            return default
+        value = value.get(arg, default)
+
+    return value
+
+
+def legacy_get(msg, *args, **kwargs):
+    # Message.get() before compiled accessors
+    default = kwargs.get('default', REQUIRED_FIELD)
+
+    value = _legacy_get(*args, value=msg.body, default=default)
+
+    if value is REQUIRED_FIELD:
+        raise exceptions.MissingMessageField(*args)
+
+    return value
+
+
+def record_lookups(msg_data):
+    lookups = []
+    get = Message.get
+
+    def recording_get(self, *args, default=REQUIRED_FIELD):
+        lookups.append((args, default))
+        return get(self, *args, default=default)
+
+    Message.get = recording_get
+    try:
+        handle_message(create_message(msg_data))
+    finally:
+        Message.get = get
+
+    return lookups
+
+
+def replay(msg, lookups, get):
+    for args, default in lookups:
+        try:
+            get(msg, *args, default=default)
+        except exceptions.MissingMessageField:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Message.get() micro-benchmark')
+    parser.add_argument('--rounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    utils.submit_result = lambda msg, payload: None
+
+    for name in FIXTURES:
+        with open(os.path.join(ROOT, 'tests', 'fake_messages', name + '.json')) as f:
+            msg_data = json.load(f)
+
+        lookups = record_lookups(msg_data)
+        msg = create_message(msg_data)
+        for label, get in (('legacy', legacy_get), ('compiled', type(msg).get)):
+            seconds = min(timeit.repeat(
+                lambda: replay(msg, lookups, get), number=args.rounds, repeat=3))
+            print('{0:40} {1:8} {2:3} lookups {3:8.2f} us/message'.format(
+                name, label, len(lookups), seconds / args.rounds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
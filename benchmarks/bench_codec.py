@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of encoding result payloads with the JSON backends.
+
+Payloads are created by processing messages from tests/fake_messages and
+encoded to request body bytes with the json module and with codec (orjson
+if installed).
+
+Run from the repository root:
+
+    python benchmarks/bench_codec.py [--rounds N]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from resultsdbupdater import codec, exceptions, utils  # noqa: E402
+from resultsdbupdater.consumer import handle_message  # noqa: E402
+from resultsdbupdater.message import create_message  # noqa: E402
+
+
+def load_payloads():
+    payloads = []
+    utils.submit_result = lambda msg, payload: payloads.append(json.loads(payload))
+    utils.query_first_group = lambda description: None
+
+    for path in sorted(glob.glob(os.path.join(ROOT, 'tests', 'fake_messages', '*.json'))):
+        with open(path) as f:
+            msg_data = json.load(f)
+        try:
+            handle_message(create_message(msg_data))
+        except exceptions.InvalidMessageError:
+            pass
+
+    return payloads
+
+
+def encode_json(payloads):
+    for payload in payloads:
+        json.dumps(payload).encode('utf-8')
+
+
+def encode_codec(payloads):
+    for payload in payloads:
+        codec.encode(codec.dumps(payload))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON backend micro-benchmark')
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    payloads = load_payloads()
+    size = sum(len(json.dumps(payload)) for payload in payloads)
+    print('{0} payloads, {1} bytes, codec backend: {2}'.format(
+        len(payloads), size, codec.backend()))
+
+    for label, encode in (('json', encode_json), ('codec', encode_codec)):
+        seconds = min(timeit.repeat(
+            lambda: encode(payloads), number=args.rounds, repeat=3))
+        print('{0:10} {1:8.2f} us/payload'.format(
+            label, seconds / args.rounds / len(payloads) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
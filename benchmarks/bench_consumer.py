@@ -0,0 +1,295 @@
+"""
+Benchmark of CIConsumer.consume() with messages from tests/fake_messages and
+synthetic scaled-up variants (more results per bulk or ci_metrics message,
+larger xunit data) posting results to a stub ResultsDB served over HTTP
+from this process.
+
+Reports messages per second, p50/p99 latency and peak memory allocated
+per message for each fixture, handler route and artifact type. Results can
+be saved as JSON and compared with results saved earlier, exiting with
+status 1 if any group regressed by more than the threshold.
+
+Run from the repository root:
+
+    python benchmarks/bench_consumer.py [--rounds N] [--scale N]
+        [--output FILE] [--baseline FILE [--threshold RATIO]]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import copy
+import glob
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from resultsdbupdater import codec, config, utils  # noqa: E402
+from resultsdbupdater.consumer import CIConsumer, classify_message  # noqa: E402
+from resultsdbupdater.message import create_message  # noqa: E402
+from tests.conftest import FakeHub  # noqa: E402
+
+# Compared with baseline; direction is 1 if higher values are better.
+COMPARED = (
+    ('messages_per_second', 1),
+    ('p50_ms', -1),
+    ('alloc_peak_bytes', -1),
+)
+
+
+class StubResultsDB(object):
+    """
+    Accepts all results and reports no existing groups.
+    """
+
+    def __init__(self):
+        self.posted = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, avoid waiting for
+            # delayed ACK.
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.posted += 1
+                self._reply(201, b'{}')
+
+            def do_GET(self):
+                self._reply(200, b'{"data": []}')
+
+            def _reply(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{0}/api/v2.0'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_messages():
+    messages = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'tests', 'fake_messages', '*.json'))):
+        with open(path) as f:
+            messages.append((os.path.basename(path)[:-len('.json')], json.load(f)))
+    return messages
+
+
+def scaled(msg_data, factor):
+    """
+    Returns copy of message with results and xunit data multiplied by factor
+    or None if there is nothing to scale.
+    """
+    msg_data = copy.deepcopy(msg_data)
+    body = msg_data.get('body', {}).get('msg')
+    if not isinstance(body, dict):
+        return None
+
+    changed = False
+    if isinstance(body.get('results'), dict):
+        body['results'] = {
+            '{0}.{1}'.format(name, i): copy.deepcopy(result)
+            for name, result in body['results'].items()
+            for i in range(factor)
+        }
+        changed = True
+
+    if isinstance(body.get('tests'), list):
+        body['tests'] = [copy.deepcopy(test) for test in body['tests'] for _ in range(factor)]
+        changed = True
+
+    test = body.get('test')
+    if isinstance(test, dict) and isinstance(test.get('xunit'), str):
+        test['xunit'] *= factor
+        changed = True
+
+    return msg_data if changed else None
+
+
+def describe(msg_data):
+    msg = create_message(copy.deepcopy(msg_data))
+    route = classify_message(msg)
+    try:
+        artifact_type = msg.get('artifact', 'type', default=None)
+    except Exception:
+        artifact_type = None
+    if not isinstance(artifact_type, str):
+        artifact_type = None
+    return route, artifact_type
+
+
+def percentile(sorted_values, ratio):
+    index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, peaks):
+    latencies = sorted(latencies)
+    return {
+        'messages': len(latencies),
+        'messages_per_second': len(latencies) / sum(latencies),
+        'p50_ms': percentile(latencies, 0.5) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+        'alloc_peak_bytes': sum(peaks) / len(peaks),
+    }
+
+
+def measure(consumer, stub, msg_data, rounds):
+    # Messages are consumed from copies since some handlers modify message
+    # data; copying is not measured.
+    copies = [copy.deepcopy(msg_data) for _ in range(rounds + 2)]
+    consumer.consume(copies.pop())
+
+    stub.posted = 0
+    latencies = []
+    for _ in range(rounds):
+        data = copies.pop()
+        start = time.perf_counter()
+        consumer.consume(data)
+        latencies.append(time.perf_counter() - start)
+    results = stub.posted // rounds
+
+    tracemalloc.start()
+    try:
+        data = copies.pop()
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        consumer.consume(data)
+        peak = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+    return latencies, peak, results
+
+
+def run(messages, rounds):
+    stub = StubResultsDB()
+    config.RESULTSDB_API_URL = stub.url
+    consumer = CIConsumer(FakeHub())
+    groups = {}
+    fixtures = {}
+    try:
+        for name, msg_data in messages:
+            route, artifact_type = describe(msg_data)
+            utils.GROUP_CACHE.clear()
+            latencies, peak, results = measure(consumer, stub, msg_data, rounds)
+            fixtures[name] = dict(
+                summarize(latencies, [peak]),
+                route=route, artifact_type=artifact_type, results_per_message=results)
+
+            keys = ['total', 'route:' + route]
+            if artifact_type is not None:
+                keys.append('artifact_type:' + artifact_type)
+            for key in keys:
+                group = groups.setdefault(key, ([], []))
+                group[0].extend(latencies)
+                group[1].append(peak)
+    finally:
+        consumer.stop()
+        stub.stop()
+
+    return fixtures, {
+        key: summarize(latencies, peaks) for key, (latencies, peaks) in groups.items()}
+
+
+def compare(report, baseline, threshold):
+    """
+    Returns list of regressions against baseline report.
+    """
+    regressions = []
+    for section in ('groups', 'fixtures'):
+        for key, old in sorted(baseline.get(section, {}).items()):
+            new = report[section].get(key)
+            if new is None:
+                continue
+
+            for metric, direction in COMPARED:
+                if not old.get(metric):
+                    continue
+                change = (new[metric] - old[metric]) / old[metric] * direction
+                if change < -threshold:
+                    regressions.append('{0} {1}: {2:.4g} -> {3:.4g} ({4:+.0%})'.format(
+                        key, metric, old[metric], new[metric], change * direction))
+    return regressions
+
+
+def print_report(report):
+    print('{0:58} {1:>6} {2:>9} {3:>8} {4:>8} {5:>9}'.format(
+        '', 'results', 'msg/s', 'p50 ms', 'p99 ms', 'alloc B'))
+    for section in ('fixtures', 'groups'):
+        for key, stats in sorted(report[section].items()):
+            print('{0:58} {1:>6} {2:9.0f} {3:8.3f} {4:8.3f} {5:9.0f}'.format(
+                key, stats.get('results_per_message', ''), stats['messages_per_second'],
+                stats['p50_ms'], stats['p99_ms'], stats['alloc_peak_bytes']))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consumer benchmark with stub ResultsDB')
+    parser.add_argument('--rounds', type=int, default=100, help='messages per fixture')
+    parser.add_argument('--scale', type=int, default=10, help='factor for scaled variants')
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--baseline', help='compare with results saved earlier')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='maximum allowed relative regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    messages = load_messages()
+    if args.scale > 1:
+        for name, msg_data in list(messages):
+            variant = scaled(msg_data, args.scale)
+            if variant is not None:
+                messages.append(('{0}@x{1}'.format(name, args.scale), variant))
+
+    fixtures, groups = run(messages, args.rounds)
+    report = {
+        'python': platform.python_version(),
+        'json_backend': codec.backend(),
+        'rounds': args.rounds,
+        'scale': args.scale,
+        'fixtures': fixtures,
+        'groups': groups,
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark of processing messages from tests/fake_messages.
+
+Reports CPU time and peak memory allocated while processing a message and
+memory retained by a message object (with its result and logger).
+Results are prepared as usual but not posted to ResultsDB.
+
+Run from the repository root:
+
+    python benchmarks/bench_message.py [--rounds N]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from resultsdbupdater import exceptions, utils  # noqa: E402
+from resultsdbupdater.consumer import handle_message  # noqa: E402
+from resultsdbupdater.message import create_message  # noqa: E402
+
+
+def load_messages():
+    paths = sorted(glob.glob(os.path.join(ROOT, 'tests', 'fake_messages', '*.json')))
+    messages = []
+    for path in paths:
+        with open(path) as f:
+            messages.append((os.path.basename(path), json.load(f)))
+    return messages
+
+
+def process(msg_data):
+    try:
+        handle_message(create_message(msg_data))
+    except exceptions.InvalidMessageError:
+        pass
+
+
+def measure_cpu(messages, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        for _, msg_data in messages:
+            process(msg_data)
+    return (time.process_time() - start) / rounds / len(messages)
+
+
+def measure_memory(messages):
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for name, msg_data in messages:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            process(msg_data)
+            peaks[name] = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def measure_model_size(messages, count=1000):
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        retained = []
+        for i in range(count):
+            msg = create_message(messages[i % len(messages)][1])
+            msg.result
+            msg.log
+            retained.append(msg)
+        return (tracemalloc.get_traced_memory()[0] - start) / count
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Message processing micro-benchmark')
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    utils.submit_result = lambda msg, payload: None
+    utils.query_first_group = lambda description: None
+
+    messages = load_messages()
+    # Warm up caches and imports.
+    measure_cpu(messages, 1)
+
+    cpu = measure_cpu(messages, args.rounds)
+    peaks = measure_memory(messages)
+    model_size = measure_model_size(messages)
+
+    for name, _ in messages:
+        print('{0:60} {1:8} B'.format(name, peaks[name]))
+    print('{0:60} {1:8.0f} B'.format('mean peak allocation', sum(peaks.values()) / len(peaks)))
+    print('{0:60} {1:8.0f} B'.format('message object size', model_size))
+    print('{0:60} {1:8.1f} us'.format('mean CPU time', cpu * 1e6))
+
+
+if __name__ == '__main__':
+    main()
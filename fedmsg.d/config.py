@@ -27,4 +27,56 @@ config = {
     'resultsdb-updater.private_testcase_publisher_map': (
         ('prodsec.*', 'msg-producer-prodsec'),
     ),
+    # Post results from worker threads instead of the thread consuming
+    # messages (zero disables this).
+    # 'resultsdb-updater.pipeline_workers': 4,
+    # 'resultsdb-updater.pipeline_queue_size': 1000,
+    # Parallel requests for messages with multiple results.
+    # 'resultsdb-updater.batch_max_in_flight': 8,
+    # Cache for groups looked up by description (zero size disables it).
+    # 'resultsdb-updater.group_cache_size': 1024,
+    # 'resultsdb-updater.group_cache_ttl': 600,
+    # SQLite database persisting group UUIDs across restarts.
+    # 'resultsdb-updater.group_index_path': '/var/lib/resultsdb-updater/groups.sqlite',
+    # 'resultsdb-updater.group_index_size': 100000,
+    # 'resultsdb-updater.group_index_max_age': 7 * 24 * 3600,
+    # Use asyncio ResultsDB client (requires aiohttp) instead of requests.
+    # 'resultsdb-updater.client': 'asyncio',
+    # 'resultsdb-updater.async_max_in_flight': 100,
+    # Retry failed results later in background instead of blocking message
+    # processing (in-line retries drop from 24 to session_retries).
+    # 'resultsdb-updater.retry_queue': True,
+    # 'resultsdb-updater.retry_max_attempts': 20,
+    # 'resultsdb-updater.retry_backoff_factor': 1,
+    # 'resultsdb-updater.retry_max_backoff': 300,
+    # 'resultsdb-updater.retry_queue_size': 10000,
+    # 'resultsdb-updater.session_retries': 2,
+    # Fail fast after consecutive failed requests to ResultsDB (zero disables
+    # this; in-line retries drop to session_retries too); failed results are
+    # retried later if retry_queue is enabled.
+    # 'resultsdb-updater.circuit_breaker_threshold': 5,
+    # 'resultsdb-updater.circuit_breaker_reset_timeout': 30,
+    # Write results to on-disk spool before posting them and post results
+    # left in the spool after restart.
+    # 'resultsdb-updater.spool_dir': '/var/lib/resultsdb-updater/spool',
+    # 'resultsdb-updater.spool_segment_size': 16 * 1024 * 1024,
+    # 'resultsdb-updater.spool_max_segments': 8,
+    # 'resultsdb-updater.spool_fsync_interval': 0.1,
+    # Store rejected messages for later replay with resultsdb-updater-replay.
+    # 'resultsdb-updater.dead_letter_dir': '/var/lib/resultsdb-updater/dead-letter',
+    # Expose metrics in Prometheus format on http://<address>:<port>/metrics.
+    # 'resultsdb-updater.metrics_port': 9090,
+    # 'resultsdb-updater.metrics_address': '',
+    # Report time spent in each message processing stage (here as metrics).
+    # 'resultsdb-updater.timing_hooks': ['resultsdbupdater.timing:observe_metrics'],
+    # Export spans from message publishing to results accepted by ResultsDB.
+    # 'resultsdb-updater.trace_file': '/var/log/resultsdb-updater/spans.jsonl',
+    # Profile for 30 seconds after "kill -USR2 <pid>" (collapsed stacks for
+    # flamegraph.pl and optionally tracemalloc snapshot).
+    # 'resultsdb-updater.profile_dir': '/var/tmp/resultsdb-updater/profiles',
+    # 'resultsdb-updater.profile_signal': 'SIGUSR2',
+    # 'resultsdb-updater.profile_on_start': False,
+    # 'resultsdb-updater.profile_duration': 30,
+    # 'resultsdb-updater.profile_interval': 0.01,
+    # 'resultsdb-updater.profile_tracemalloc': False,
 }
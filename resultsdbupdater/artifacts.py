@@ -0,0 +1,274 @@
+"""
+Result data extractors for artifact types in Fedora CI messages.
+
+See: https://pagure.io/fedora-ci/messages
+"""
+import json
+import re
+
+from . import exceptions
+from .message import REQUIRED_FIELD
+
+# The pagure.io/messages spec defines the NSVC delimited with ':' and the stream name can
+# contain '-', which MBS changes to '_' when importing to koji.
+# See https://github.com/release-engineering/resultsdb-updater/pull/73
+NSVC_REGEX = re.compile('^(.*):(.*):(.*):(.*)')
+
+# Result data extractors by artifact type; each is called with a message
+# and returns a new result data dict.
+ARTIFACT_TYPES = {}
+
+
+def field(*path, default=REQUIRED_FIELD):
+    """
+    Returns getter of a message field.
+    """
+    return lambda msg: msg.get(*path, default=default)
+
+
+def artifact(*path, default=REQUIRED_FIELD):
+    return field('artifact', *path, default=default)
+
+
+def run(*path, default=REQUIRED_FIELD):
+    return field('run', *path, default=default)
+
+
+def system(name, default=REQUIRED_FIELD):
+    return lambda msg: msg.system(name, default=default)
+
+
+def category(msg):
+    return msg.result.category
+
+
+def xunit(msg):
+    return msg.result.xunit
+
+
+def register_artifact_type(item_type, fields, derive=None, omit_none=False):
+    """
+    Compiles and registers result data extractor for an artifact type.
+
+    Args:
+        item_type (string) - Artifact type, also used as "type" in result
+            data (unless overridden by derive)
+        fields (tuple) - Pairs of result data key and getter, called with
+            message
+        derive (callable) - Called with message before getters, returns dict
+            with other result data computed from multiple message fields
+        omit_none (bool) - Omit result data with None values
+    """
+    getters = tuple(fields)
+
+    def extract(msg):
+        result_data = {'type': item_type}
+        if derive is not None:
+            for key, value in derive(msg).items():
+                if value is not None or not omit_none:
+                    result_data[key] = value
+
+        for key, get in getters:
+            value = get(msg)
+            if value is not None or not omit_none:
+                result_data[key] = value
+
+        return result_data
+
+    ARTIFACT_TYPES[item_type] = extract
+
+
+def _productmd_compose(msg):
+    architecture = msg.system('architecture')
+    variant = msg.system('variant', default=None)
+    # Field compose_id in artifacts is deprecated.
+    compose_id = msg.get('artifact', 'id', default=None) or msg.get('artifact', 'compose_id')
+    return {
+        'item': '{0}/{1}/{2}'.format(compose_id, variant or 'unknown', architecture),
+        'productmd.compose.id': compose_id,
+        'system_architecture': architecture,
+        'system_variant': variant,
+    }
+
+
+def _product_build(msg):
+    product = msg.get('artifact', 'name')
+    version = msg.get('artifact', 'version')
+    release = msg.get('artifact', 'release')
+    return {
+        'item': '{0}-{1}-{2}'.format(product, version, release),
+        'product': product,
+        'version': version,
+        'release': release,
+    }
+
+
+def _component_version(msg):
+    component = msg.get('artifact', 'component')
+    version = msg.get('artifact', 'version')
+    return {
+        'item': '{0}-{1}'.format(component, version),
+        'component': component,
+        'version': version,
+    }
+
+
+def _container_image(msg):
+    repo = msg.get('artifact', 'repository')
+    digest = msg.get('artifact', 'digest')
+    return {'item': '{0}@{1}'.format(repo, digest)}
+
+
+def _redhat_module(msg):
+    nsvc = msg.get('artifact', 'nsvc')
+    try:
+        name, stream, version, context = NSVC_REGEX.match(nsvc).groups()
+        stream = stream.replace('-', '_')
+    except AttributeError:
+        raise exceptions.InvalidMessageError('Invalid nsvc "%s" encountered' % nsvc)
+
+    nsvc = '{}-{}-{}.{}'.format(name, stream, version, context)
+    return {'item': nsvc, 'nsvc': nsvc}
+
+
+def _brew_build(msg):
+    item = msg.get('artifact', 'nvr')
+    component = msg.get('artifact', 'component')
+    scratch = msg.get('artifact', 'scratch', default='')
+    brew_task_id = msg.get('artifact', 'id', default=None)
+
+    # scratch is supposed to be a bool but some messages in the wild
+    # use a string instead
+    if not isinstance(scratch, bool):
+        try:
+            scratch = scratch.lower() == 'true'
+        except AttributeError:
+            scratch = False
+
+    return {
+        'item': item,
+        # we need to differentiate between scratch and non-scratch builds
+        'type': 'brew-build_scratch' if scratch else 'brew-build',
+        'brew_task_id': brew_task_id,
+        'component': component,
+        'scratch': scratch,
+    }
+
+
+def _product_scenario(msg):
+    product_scenario = msg.get('artifact', 'id')
+    products = msg.get('artifact', 'products')
+    products_data = [json.dumps(product) for product in products]
+    item = [product.get('nvr', product['id']) for product in products]
+    item.insert(0, product_scenario)
+    return {'item': item, 'products': products_data}
+
+
+register_artifact_type('productmd-compose', derive=_productmd_compose, omit_none=True, fields=(
+    ('log', run('log')),
+    ('system_provider', system('provider')),
+    ('category', category),
+))
+
+register_artifact_type('product-build', derive=_product_build, omit_none=True, fields=(
+    ('log', run('log')),
+    ('system_architecture', system('architecture')),
+    ('category', category),
+))
+
+register_artifact_type('component-version', derive=_component_version, omit_none=True, fields=(
+    ('log', run('log')),
+    ('category', category),
+))
+
+register_artifact_type('container-image', derive=_container_image, omit_none=True, fields=(
+    ('log', run('log')),
+    ('rebuild', run('rebuild', default=None)),
+    ('xunit', xunit),
+    ('repository', artifact('repository', default=None)),
+    ('digest', artifact('digest', default=None)),
+    ('format', artifact('format', default=None)),
+    ('pull_ref', artifact('pull_ref', default=None)),
+    ('scratch', artifact('scratch', default=None)),
+    ('nvr', artifact('nvr', default=None)),
+    ('issuer', artifact('issuer', default=None)),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+    ('system_architecture', system('architecture', default=None)),
+    ('category', category),
+))
+
+register_artifact_type('redhat-container-image', fields=(
+    ('item', artifact('id')),
+    ('brew_task_id', artifact('task_id', default=None)),
+    ('brew_build_id', artifact('build_id', default=None)),
+    ('category', category),
+    ('full_names', artifact('full_names')),
+    ('registry_url', artifact('registry_url', default=None)),
+    ('tag', artifact('tag', default=None)),
+    ('issuer', artifact('issuer')),
+    ('component', artifact('component')),
+    ('name', artifact('name', default=None)),
+    ('namespace', artifact('namespace')),
+    ('scratch', artifact('scratch')),
+    ('nvr', artifact('nvr')),
+    ('source', artifact('source')),
+    ('rebuild', run('rebuild', default=None)),
+    ('log', run('log')),
+))
+
+register_artifact_type('redhat-module', derive=_redhat_module, fields=(
+    ('mbs_id', artifact('id', default=None)),
+    ('category', category),
+    ('context', artifact('context')),
+    ('name', artifact('name')),
+    ('stream', artifact('stream')),
+    ('version', artifact('version')),
+    ('issuer', artifact('issuer', default=None)),
+    ('rebuild', run('rebuild', default=None)),
+    ('log', run('log')),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+))
+
+register_artifact_type('redhat-advisory', fields=(
+    ('item', artifact('id')),
+    ('category', category),
+    ('numeric_id', artifact('numeric_id', default=None)),
+    ('pipeline_id', field('pipeline', 'id')),
+    ('pipeline_name', field('pipeline', 'name')),
+    ('pipeline_build', field('pipeline', 'build', default=None)),
+    ('pipeline_stage', field('pipeline', 'stage', 'name', default=None)),
+    ('log', run('log')),
+    ('log_raw', run('log_raw', default=None)),
+    ('log_stream', run('log_stream', default=None)),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+))
+
+register_artifact_type('brew-build', derive=_brew_build, fields=(
+    ('category', category),
+    ('issuer', artifact('issuer', default=None)),
+    ('rebuild', run('rebuild', default=None)),
+    ('log', run('log')),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+))
+
+register_artifact_type('brew-build-group', fields=(
+    ('item', artifact('id')),
+    ('category', category),
+    ('repository', artifact('repository')),
+    ('builds', artifact('builds')),
+    ('rebuild', run('rebuild', default=None)),
+    ('log', run('log')),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+))
+
+register_artifact_type('product-scenario', derive=_product_scenario, fields=(
+    ('rebuild', run('rebuild', default=None)),
+    ('log', run('log')),
+    ('system_os', system('os', default=None)),
+    ('system_provider', system('provider', default=None)),
+))
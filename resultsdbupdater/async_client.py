@@ -0,0 +1,210 @@
+import asyncio
+import ssl
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import codec, config, exceptions, metrics, timing, tracing, utils
+from .deadletter import handle_error
+from .retry import is_retriable
+
+
+def _ssl_context(trusted_ca):
+    # Same meaning as "verify" argument in requests.
+    if trusted_ca is None or trusted_ca is True:
+        return None
+    if trusted_ca is False:
+        return False
+    return ssl.create_default_context(cafile=trusted_ca)
+
+
+class AsyncResultsDBClient(object):
+    """
+    ResultsDB client keeping many requests in flight on a single thread.
+
+    The client runs its own event loop in a background thread. Results are
+    submitted to it without waiting for the response and at most
+    max_in_flight requests are sent at a time. Submitting blocks if there
+    are already max_pending results waiting.
+
+    Requires aiohttp.
+    """
+
+    def __init__(self, max_in_flight, max_pending, retry_queue=None):
+        """
+        Args:
+            max_in_flight (int) - Maximum number of concurrent requests
+            max_pending (int) - Maximum number of submitted results not yet
+                posted
+            retry_queue (RetryQueue) - Retries submitted results which failed
+                to be posted
+        """
+        if aiohttp is None:
+            raise RuntimeError('The asyncio ResultsDB client requires aiohttp')
+
+        self.max_in_flight = max_in_flight
+        self.retry_queue = retry_queue
+        # Spool to mark posted results done in
+        self.spool = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name='AsyncResultsDBClient')
+        self.thread.daemon = True
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+        self._session = None
+        self._requests = None
+
+    def __len__(self):
+        """
+        Returns number of submitted results not yet posted.
+        """
+        with self._futures_lock:
+            return len(self._futures)
+
+    def start(self):
+        self.thread.start()
+        self._run(self._open())
+
+    def stop(self):
+        """
+        Waits for submitted results and stops the event loop.
+        """
+        self.join()
+        self._run(self._session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def join(self):
+        """
+        Blocks until all submitted results are processed.
+        """
+        while True:
+            with self._futures_lock:
+                futures = list(self._futures)
+            if not futures:
+                return
+            for future in futures:
+                future.exception()
+
+    def submit_result(self, msg, payload):
+        self._pending.acquire()
+        future = asyncio.run_coroutine_threadsafe(
+            self._post_result_logged(msg, payload), self.loop)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def post_result(self, msg, payload):
+        return self._run(self.async_post_result(msg, payload))
+
+    def query_first_group(self, description):
+        return self._run(self.async_query_first_group(description))
+
+    async def async_post_result(self, msg, payload):
+        return await self._circuit_breaker(self._post_result(msg, payload))
+
+    async def async_query_first_group(self, description):
+        return await self._circuit_breaker(self._query_first_group(description))
+
+    async def _circuit_breaker(self, coroutine):
+        breaker = utils.CIRCUIT_BREAKER
+        if breaker is None:
+            return await coroutine
+
+        try:
+            breaker.allow()
+        except exceptions.CircuitOpenError:
+            coroutine.close()
+            raise
+
+        try:
+            result = await coroutine
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+
+        breaker.record_success()
+        return result
+
+    async def _post_result(self, msg, payload):
+        log = msg.log
+        log.debug('Requesting new result: %s', payload)
+
+        auth = None
+        if config.RESULTSDB_AUTH:
+            auth = aiohttp.BasicAuth(*config.RESULTSDB_AUTH)
+
+        async with self._requests:
+            started = time.time()
+            with timing.stage(timing.STAGE_HTTP, msg), \
+                    metrics.REQUEST_DURATION.time('create_result'):
+                async with self._session.post(
+                        '{0}/results'.format(config.RESULTSDB_API_URL),
+                        data=codec.encode(payload),
+                        headers={
+                            'content-type': 'application/json',
+                        },
+                        auth=auth) as response:
+                    log.debug('New result requested (HTTP %s)', response.status)
+
+                    if response.status == 400:
+                        message = (await response.json()).get('message')
+                        raise exceptions.CreateResultError(message, payload)
+
+                    response.raise_for_status()
+
+        tracing.result_accepted(msg, started)
+
+    async def _query_first_group(self, description):
+        async with self._requests:
+            with timing.stage(timing.STAGE_HTTP), \
+                    metrics.REQUEST_DURATION.time('get_first_group'):
+                async with self._session.get(
+                        '{0}/groups'.format(config.RESULTSDB_API_URL),
+                        params={'description': description}) as response:
+                    response.raise_for_status()
+                    data = (await response.json())['data']
+
+        if len(data) > 0:
+            return data[0]
+
+        return {}
+
+    async def _open(self):
+        self._requests = asyncio.Semaphore(self.max_in_flight)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_in_flight, ssl=_ssl_context(config.TRUSTED_CA)),
+            headers={'User-Agent': config.USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=config.TIMEOUT),
+            raise_for_status=False)
+
+    async def _post_result_logged(self, msg, payload):
+        try:
+            await self.async_post_result(msg, payload)
+        except Exception as e:
+            if self.retry_queue is not None and self.retry_queue.retry_later(msg, payload, e):
+                return
+
+            handle_error(msg, e, payload)
+            if is_retriable(e):
+                # Keep the result in spool so it's posted again after restart.
+                return
+
+        if self.spool is not None:
+            self.spool.done(payload)
+
+    def _done(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+        self._pending.release()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from . import exceptions
+from .retry import is_retriable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+STATES = (CLOSED, OPEN, HALF_OPEN)
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast on ResultsDB requests while ResultsDB is unavailable.
+
+    The circuit opens after failure_threshold consecutive failures (only
+    connection errors, timeouts and server errors are counted). While open,
+    requests fail immediately with CircuitOpenError. After reset_timeout
+    seconds, the circuit is half-open and allows up to half_open_probes
+    requests through: the first success closes the circuit and a failure
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, half_open_probes=1,
+                 timer=time.monotonic):
+        """
+        Args:
+            failure_threshold (int) - Consecutive failures opening the circuit
+            reset_timeout (float) - Seconds after which open circuit allows
+                probe requests
+            half_open_probes (int) - Concurrent probe requests allowed while
+                half-open
+            timer (callable) - Returns current time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.timer = timer
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """
+        Raises CircuitOpenError if a request is not allowed now.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._state = HALF_OPEN
+                self._probes += 1
+                return
+
+            self.rejected += 1
+            raise exceptions.CircuitOpenError()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probes = 0
+            self._state = CLOSED
+
+    def record_failure(self, error):
+        if not is_retriable(error):
+            # ResultsDB is available, e.g. it rejected invalid result.
+            self.record_success()
+            return
+
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = self.timer()
+                self._probes = 0
+
+    def call(self, fn, *args, **kwargs):
+        self.allow()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+
+        self.record_success()
+        return result
+
+    def _current_state(self):
+        if (self._state == OPEN
+                and self.timer() >= self._opened_at + self.reset_timeout):
+            return HALF_OPEN
+        return self._state
@@ -0,0 +1,58 @@
+"""
+JSON encoding for request bodies and stored records.
+
+Uses orjson if it's installed (resultsdb-updater[orjson]), otherwise the
+standard json module. Encoded JSON is returned as str, non-ASCII characters
+may not be escaped so use encode() to get request body bytes.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def backend():
+    """
+    Returns name of JSON backend in use.
+    """
+    return 'json' if orjson is None else 'orjson'
+
+
+def dumps(obj, default=None):
+    """
+    Returns object encoded as compact JSON.
+
+    Args:
+        obj - Object to encode
+        default (callable) - Called for objects which cannot be encoded,
+            returns encodable replacement
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # E.g. integers larger than 64 bits, let json module handle these.
+            pass
+
+    return json.dumps(obj, default=default, separators=(',', ':'))
+
+
+def loads(data):
+    """
+    Returns object decoded from JSON str or bytes.
+
+    Raises ValueError if the data are not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode(text):
+    """
+    Returns encoded JSON as request body bytes.
+    """
+    return text.encode('utf-8')
@@ -58,3 +58,96 @@ RESULTSDB_AUTH = get_http_auth(
 # messages.
 PRIVATE_TESTCASE_PUBLISHER_MAP = CONFIG.get(
     'resultsdb-updater.private_testcase_publisher_map', ())
+
+# Number of worker threads posting results to ResultsDB. If zero, results
+# are posted directly from the thread consuming messages.
+PIPELINE_WORKERS = CONFIG.get('resultsdb-updater.pipeline_workers', 0)
+# Maximum number of prepared results waiting for a worker thread. Consuming
+# messages blocks when the queue is full.
+PIPELINE_QUEUE_SIZE = CONFIG.get('resultsdb-updater.pipeline_queue_size', 1000)
+
+# Maximum number of parallel requests when posting multiple results created
+# for a single message.
+BATCH_MAX_IN_FLIGHT = CONFIG.get('resultsdb-updater.batch_max_in_flight', 1)
+
+# Maximum number of cached groups (zero disables the cache) and number of
+# seconds after which a cached group expires.
+GROUP_CACHE_SIZE = CONFIG.get('resultsdb-updater.group_cache_size', 1024)
+GROUP_CACHE_TTL = CONFIG.get('resultsdb-updater.group_cache_ttl', 600)
+
+# Path to SQLite database persisting group UUIDs across restarts (disabled
+# if not set), maximum number of groups in it and number of seconds after
+# which the groups expire.
+GROUP_INDEX_PATH = CONFIG.get('resultsdb-updater.group_index_path')
+GROUP_INDEX_SIZE = CONFIG.get('resultsdb-updater.group_index_size', 100000)
+GROUP_INDEX_MAX_AGE = CONFIG.get('resultsdb-updater.group_index_max_age', 7 * 24 * 3600)
+
+# ResultsDB client: "requests" (blocking, default) or "asyncio" (requires
+# aiohttp, keeps up to ASYNC_MAX_IN_FLIGHT requests in flight on a single
+# thread; results waiting to be posted are limited by PIPELINE_QUEUE_SIZE).
+RESULTSDB_CLIENT = CONFIG.get('resultsdb-updater.client', 'requests')
+ASYNC_MAX_IN_FLIGHT = CONFIG.get('resultsdb-updater.async_max_in_flight', 100)
+
+# Retry posting failed results later from a background thread instead of
+# blocking message processing with many retries in the requests session.
+RETRY_QUEUE = CONFIG.get('resultsdb-updater.retry_queue', False)
+# Maximum number of attempts to post a result from the retry queue, delay in
+# seconds before the first retry (doubled for each next retry), maximum
+# delay and maximum number of results waiting for retry.
+RETRY_MAX_ATTEMPTS = CONFIG.get('resultsdb-updater.retry_max_attempts', 20)
+RETRY_BACKOFF_FACTOR = CONFIG.get('resultsdb-updater.retry_backoff_factor', 1)
+RETRY_MAX_BACKOFF = CONFIG.get('resultsdb-updater.retry_max_backoff', 300)
+RETRY_QUEUE_SIZE = CONFIG.get('resultsdb-updater.retry_queue_size', 10000)
+
+# Number of consecutive failed requests to ResultsDB after which requests
+# fail immediately (zero disables this) and number of seconds after which
+# a probe request is allowed.
+CIRCUIT_BREAKER_THRESHOLD = CONFIG.get('resultsdb-updater.circuit_breaker_threshold', 0)
+CIRCUIT_BREAKER_RESET_TIMEOUT = CONFIG.get(
+    'resultsdb-updater.circuit_breaker_reset_timeout', 30)
+
+# Number of in-line retries in the requests session. Only a few by default
+# with retry queue or circuit breaker, otherwise each failure would wait
+# for the long in-line retry schedule before it's retried later or counted
+# by the circuit breaker.
+SESSION_RETRIES = CONFIG.get(
+    'resultsdb-updater.session_retries',
+    2 if RETRY_QUEUE or CIRCUIT_BREAKER_THRESHOLD > 0 else 24)
+
+# Directory for durable spool of results waiting to be posted (disabled if
+# not set). Results not posted before the service stops are posted again on
+# start. See spool.Spool for other options.
+SPOOL_DIR = CONFIG.get('resultsdb-updater.spool_dir')
+SPOOL_SEGMENT_SIZE = CONFIG.get('resultsdb-updater.spool_segment_size', 16 * 1024 * 1024)
+SPOOL_MAX_SEGMENTS = CONFIG.get('resultsdb-updater.spool_max_segments', 8)
+SPOOL_FSYNC_INTERVAL = CONFIG.get('resultsdb-updater.spool_fsync_interval', 0.1)
+
+# Directory for messages and results rejected by ResultsDB or rejected as
+# invalid (disabled if not set). These can be replayed later with the
+# resultsdb-updater-replay command.
+DEAD_LETTER_DIR = CONFIG.get('resultsdb-updater.dead_letter_dir')
+
+# Port for HTTP server exposing metrics in Prometheus format (disabled if
+# zero) and address to listen on (all interfaces by default).
+METRICS_PORT = CONFIG.get('resultsdb-updater.metrics_port', 0)
+METRICS_ADDRESS = CONFIG.get('resultsdb-updater.metrics_address', '')
+
+# Hooks called with durations of message processing stages, given as
+# "package.module:function" (see timing module).
+TIMING_HOOKS = CONFIG.get('resultsdb-updater.timing_hooks', [])
+
+# File to append spans to as JSON lines (disabled if not set). See tracing
+# module.
+TRACE_FILE = CONFIG.get('resultsdb-updater.trace_file')
+
+# Directory for profiles of the running consumer (profiling is disabled if
+# not set). Profiling starts on receiving the signal or on start if
+# profile_on_start is True; stacks are sampled every profile_interval
+# seconds for profile_duration seconds. If profile_tracemalloc is True,
+# memory allocated and not freed meanwhile is saved as tracemalloc snapshot.
+PROFILE_DIR = CONFIG.get('resultsdb-updater.profile_dir')
+PROFILE_SIGNAL = CONFIG.get('resultsdb-updater.profile_signal', 'SIGUSR2')
+PROFILE_ON_START = CONFIG.get('resultsdb-updater.profile_on_start', False)
+PROFILE_DURATION = CONFIG.get('resultsdb-updater.profile_duration', 30)
+PROFILE_INTERVAL = CONFIG.get('resultsdb-updater.profile_interval', 0.01)
+PROFILE_TRACEMALLOC = CONFIG.get('resultsdb-updater.profile_tracemalloc', False)
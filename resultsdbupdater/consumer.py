@@ -1,14 +1,112 @@
+import functools
+import signal
+
 import fedmsg.consumers
 import fedmsg.config
 
-from . import config, exceptions, utils
+from . import config, metrics, timing, tracing, utils
 
-from .message import create_message
+from .async_client import AsyncResultsDBClient
+from .breaker import STATES as CIRCUIT_BREAKER_STATES
+from .deadletter import handle_error
+from .message import Message, create_message
+from .pipeline import ResultPipeline
+from .profiler import Profiler
+from .retry import RetryQueue
+from .spool import Spool
 
 CONFIG = fedmsg.config.load_config()
 TOPICS = CONFIG.get('resultsdb-updater.topics', [])
 
 
+# Message routes
+ROUTE_DROPPED = 'dropped'
+ROUTE_CI_METRICS = 'ci_metrics'
+ROUTE_CI_UMB = 'ci_umb'
+ROUTE_RESULTSDB = 'resultsdb'
+ROUTE_UNHANDLED = 'unhandled'
+
+# Messages handled by topic, for legacy formats.
+TOPIC_ROUTES = {
+    '/topic/VirtualTopic.eng.platformci.tier1.result': ROUTE_CI_METRICS,
+}
+
+# Topics without warnings about unhandled messages since there will be many.
+MUTED_TOPICS = frozenset([
+    '/topic/VirtualTopic.qe.ci.jenkins',
+])
+
+# The "FACTORY 2.0 CI UMB messages"
+# See: https://pagure.io/fedora-ci/messages
+CI_UMB_KEYS = frozenset(['run', 'artifact'])
+CONTACT_UMB_KEYS = frozenset(['ci', 'contact'])
+
+# The "resultsdb" format.
+# https://mojo.redhat.com/docs/DOC-1131637
+SINGLE_KEYS = frozenset(['data', 'outcome', 'ref_url', 'testcase'])
+BULK_KEYS = frozenset(['results', 'ref_url'])
+
+ROUTE_HANDLERS = {
+    ROUTE_CI_METRICS: utils.handle_ci_metrics,
+    ROUTE_CI_UMB: utils.handle_ci_umb,
+    ROUTE_RESULTSDB: utils.handle_resultsdb_format,
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _topic_route(topic):
+    # Returns route for messages with given topic (None if the message body
+    # needs to be checked) and whether to warn about unhandled messages.
+    return TOPIC_ROUTES.get(topic), topic not in MUTED_TOPICS
+
+
+def classify_message(msg):
+    """
+    Returns route for a message.
+    """
+    # Some of the messages here can be empty strings, so only process
+    # them if they are dicts to avoid tracebacks
+    body = msg.body
+    if not isinstance(body, dict):
+        return ROUTE_DROPPED
+
+    # First, look by topic to see if the message is one of the old formats
+    # we want to handle for legacy reasons.
+    route = _topic_route(msg.topic)[0]
+    if route is not None:
+        return route
+
+    # Next, detect if the message bears the primary format we support, then
+    # the secondary format. Comparing the key view with frozensets doesn't
+    # build a set of all keys in the message.
+    keys = body.keys()
+    if keys >= CI_UMB_KEYS and not keys.isdisjoint(CONTACT_UMB_KEYS):
+        return ROUTE_CI_UMB
+
+    if keys >= SINGLE_KEYS or keys >= BULK_KEYS:
+        return ROUTE_RESULTSDB
+
+    return ROUTE_UNHANDLED
+
+
+def handle_message(msg):
+    """
+    Creates results in ResultsDB from a supported message.
+    """
+    with timing.stage(timing.STAGE_CLASSIFY, msg):
+        route = classify_message(msg)
+    metrics.MESSAGES.inc(route)
+
+    handler = ROUTE_HANDLERS.get(route)
+    if handler is not None:
+        with timing.stage(timing.STAGE_EXTRACT, msg):
+            handler(msg)
+    elif route == ROUTE_DROPPED:
+        msg.log.debug("Dropping non-dict message.")
+    elif _topic_route(msg.topic)[1]:
+        msg.log.warning('Received unhandled message %r', msg)
+
+
 class CIConsumer(fedmsg.consumers.FedmsgConsumer):
     topic = TOPICS
     config_key = 'ciconsumer'
@@ -16,6 +114,195 @@ class CIConsumer(fedmsg.consumers.FedmsgConsumer):
     def __init__(self, *args, **kw):
         super(CIConsumer, self).__init__(*args, **kw)
 
+        self.pipeline = None
+        self.async_client = None
+        self.retry_queue = None
+        self.spool = None
+        self.metrics_server = None
+        self.timing_hooks = [timing.load_hook(path) for path in config.TIMING_HOOKS]
+        self._setup_result_submission()
+        self._setup_metrics()
+
+        if config.TRACE_FILE:
+            tracing.span_exporter = tracing.SpanFileExporter(config.TRACE_FILE)
+
+        self.profiler = None
+        self._previous_signal_handler = None
+        if config.PROFILE_DIR:
+            self._setup_profiler()
+
+        for hook in self.timing_hooks:
+            timing.add_hook(hook)
+
+    def _setup_result_submission(self):
+        if config.RESULTSDB_CLIENT == 'asyncio':
+            if config.PIPELINE_WORKERS > 0:
+                raise RuntimeError(
+                    'Worker threads cannot be used with asyncio ResultsDB client')
+            self.async_client = AsyncResultsDBClient(
+                config.ASYNC_MAX_IN_FLIGHT, config.PIPELINE_QUEUE_SIZE)
+            self.async_client.start()
+            post = self.async_client.post_result
+            submit = self.async_client.submit_result
+            utils.query_first_group = self.async_client.query_first_group
+        elif config.RESULTSDB_CLIENT == 'requests':
+            post = submit = utils.post_result
+        else:
+            raise RuntimeError(
+                'Unknown ResultsDB client "{0}"'.format(config.RESULTSDB_CLIENT))
+
+        if config.SPOOL_DIR:
+            self.spool = Spool(
+                config.SPOOL_DIR,
+                segment_size=config.SPOOL_SEGMENT_SIZE,
+                max_segments=config.SPOOL_MAX_SEGMENTS,
+                fsync_interval=config.SPOOL_FSYNC_INTERVAL)
+            post = self.spool.wrap_post(post)
+            if self.async_client is not None:
+                self.async_client.spool = self.spool
+            else:
+                submit = post
+
+        if config.RETRY_QUEUE:
+            self.retry_queue = RetryQueue(
+                post,
+                max_attempts=config.RETRY_MAX_ATTEMPTS,
+                backoff_factor=config.RETRY_BACKOFF_FACTOR,
+                max_backoff=config.RETRY_MAX_BACKOFF,
+                maxsize=config.RETRY_QUEUE_SIZE)
+            self.retry_queue.start()
+            if self.async_client is not None:
+                self.async_client.retry_queue = self.retry_queue
+            else:
+                submit = self.retry_queue.submit
+
+        if config.PIPELINE_WORKERS > 0:
+            self.pipeline = ResultPipeline(
+                config.PIPELINE_WORKERS, config.PIPELINE_QUEUE_SIZE, submit)
+            self.pipeline.start()
+            submit = self.pipeline.put
+
+        utils.submit_result = submit
+
+        if self.spool is not None:
+            self._replay_spool(submit)
+            utils.submit_result = self.spool.wrap_submit(submit)
+
+    def _queues(self):
+        return (
+            ('pipeline', self.pipeline, lambda: self.pipeline.queue.qsize()),
+            ('asyncio', self.async_client, lambda: len(self.async_client)),
+            ('retry', self.retry_queue, lambda: len(self.retry_queue)),
+            ('spool', self.spool, lambda: len(self.spool)),
+        )
+
+    def _metric_functions(self):
+        """
+        Returns list of (metric, label values, function) for metrics computed
+        when collected.
+        """
+        functions = [
+            (metrics.QUEUE_SIZE, (name,), size)
+            for name, queue, size in self._queues()
+            if queue is not None
+        ]
+
+        functions.append((metrics.GROUP_CACHE_LOOKUPS, ('hit',), lambda: utils.GROUP_CACHE.hits))
+        functions.append((
+            metrics.GROUP_CACHE_LOOKUPS, ('miss',), lambda: utils.GROUP_CACHE.misses))
+
+        breaker = utils.CIRCUIT_BREAKER
+        if breaker is not None:
+            functions.append((metrics.CIRCUIT_BREAKER_OPENED, (), lambda: breaker.opened))
+            functions.append((metrics.CIRCUIT_BREAKER_REJECTED, (), lambda: breaker.rejected))
+            for state in CIRCUIT_BREAKER_STATES:
+                functions.append((
+                    metrics.CIRCUIT_BREAKER_STATE, (state,),
+                    lambda state=state: int(breaker.state == state)))
+
+        return functions
+
+    def _setup_metrics(self):
+        for metric, label_values, fn in self._metric_functions():
+            metric.set_function(fn, *label_values)
+
+        if config.METRICS_PORT:
+            self.metrics_server = metrics.start_http_server(
+                config.METRICS_PORT, config.METRICS_ADDRESS)
+            config.LOGGER.info(
+                'Serving metrics on port %s', self.metrics_server.server_address[1])
+
+    def _setup_profiler(self):
+        self.profiler = Profiler(
+            config.PROFILE_DIR,
+            duration=config.PROFILE_DURATION,
+            interval=config.PROFILE_INTERVAL,
+            trace_malloc=config.PROFILE_TRACEMALLOC)
+
+        if config.PROFILE_SIGNAL:
+            signum = getattr(signal, config.PROFILE_SIGNAL)
+            try:
+                self._previous_signal_handler = signal.signal(signum, self._on_profile_signal)
+            except ValueError:
+                # Signal handlers can be set only from the main thread.
+                config.LOGGER.warning(
+                    'Cannot start profiling on %s from this thread', config.PROFILE_SIGNAL)
+
+        if config.PROFILE_ON_START:
+            self.profiler.start()
+
+    def _on_profile_signal(self, signum, frame):
+        if not self.profiler.start():
+            config.LOGGER.warning('Profiling is already in progress')
+
+    def _replay_spool(self, submit):
+        pending = self.spool.pending()
+        if pending:
+            config.LOGGER.info('Replaying %s results from spool', len(pending))
+
+        for msg_id, payload in pending:
+            msg = Message({'headers': {'message-id': msg_id}})
+            try:
+                submit(msg, payload)
+            except Exception:
+                msg.log.exception('Failed to replay result from spool')
+
+    def stop(self):
+        if self._previous_signal_handler is not None:
+            signal.signal(getattr(signal, config.PROFILE_SIGNAL), self._previous_signal_handler)
+            self._previous_signal_handler = None
+
+        for hook in self.timing_hooks:
+            timing.remove_hook(hook)
+
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+
+        for metric, label_values, _ in self._metric_functions():
+            metric.remove(*label_values)
+
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+        if self.async_client is not None:
+            self.async_client.stop()
+
+        if self.retry_queue is not None:
+            self.retry_queue.stop()
+
+        if self.spool is not None:
+            self.spool.close()
+
+        utils.submit_result = utils.post_result
+        utils.query_first_group = utils.fetch_first_group
+
+        if tracing.span_exporter is not None:
+            tracing.span_exporter.close()
+            tracing.span_exporter = None
+
+        super(CIConsumer, self).stop()
+
     def validate(self, message):
         """
         Wraps fedmsg.consumers.FedmsgConsumer.validate() to avoid propagating
@@ -31,60 +318,24 @@ class CIConsumer(fedmsg.consumers.FedmsgConsumer):
             raise RuntimeWarning('Unexpected exception during message validation')
 
     def _consume_helper(self, msg):
-        # Some of the messages here can be empty strings, so only process
-        # them if they are dicts to avoid tracebacks
-        if not isinstance(msg.body, dict):
-            msg.log.debug("Dropping non-dict message.")
-            return
-
-        # First, look by topic to see if the message is one of the old formats
-        # we want to handle for legacy reasons.
-        if msg.topic == '/topic/VirtualTopic.eng.platformci.tier1.result':
-            utils.handle_ci_metrics(msg)
-            return
-
-        # The following stanzas consider if the actual message body
-        # matches one of a few patterns we support.  Start by
-        # extracting the keys borne in the message.
-        actual_keys = set(msg.body.keys())
-
-        # Next, detect if the message bears the primary format we support.
-        # The "FACTORY 2.0 CI UMB messages"
-        # See: https://pagure.io/fedora-ci/messages
-        ci_umb_keys = set(['run', 'artifact'])
-        contact_umb_keys = set(['ci', 'contact'])
-        if actual_keys.issuperset(ci_umb_keys) and not actual_keys.isdisjoint(contact_umb_keys):
-            utils.handle_ci_umb(msg)
-            return
-
-        # Next, detect if the message bears the secondary format we support:
-        # The "resultsdb" format.
-        # https://mojo.redhat.com/docs/DOC-1131637
-        single_keys = set(['data', 'outcome', 'ref_url', 'testcase'])
-        bulk_keys = set(['results', 'ref_url'])
-        if actual_keys.issuperset(single_keys) or actual_keys.issuperset(bulk_keys):
-            utils.handle_resultsdb_format(msg)
-            return
-
-        if msg.topic != '/topic/VirtualTopic.qe.ci.jenkins':
-            # Mute unhandled message warnings when the message came from
-            # VirtualTopic.qe.ci.jenkins since there will be many
-            msg.log.warning('Received unhandled message %r', msg)
+        handle_message(msg)
 
     def consume(self, msg_data):
+        with metrics.MESSAGE_DURATION.time():
+            self._consume(msg_data)
+
+    def _consume(self, msg_data):
         try:
             config.LOGGER.debug('Message received: %s', msg_data)
-            msg = create_message(msg_data)
+            with timing.stage(timing.STAGE_CREATE_MESSAGE):
+                msg = create_message(msg_data)
             msg.log.debug('%s', msg)
 
-            self._consume_helper(msg)
-        except exceptions.CreateResultError as e:
-            msg.log.error('Failed to process message: %s', e)
-        except exceptions.InvalidMessageError as e:
-            msg.log.warning('Invalid message rejected: %s', e)
-        except Exception:
-            # Disallow propagating any other exception, otherwise NACK is sent
-            # and the message is scheduled to be received later. But it seems
+            with tracing.trace(msg):
+                self._consume_helper(msg)
+        except Exception as e:
+            # Disallow propagating any exception, otherwise NACK is sent and
+            # the message is scheduled to be received later. But it seems
             # these messages can be only received by other consumer (or after
             # restart) otherwise the messages can block the queue completely.
-            msg.log.exception('Unexpected exception')
+            handle_error(msg, e)
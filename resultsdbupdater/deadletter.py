@@ -0,0 +1,156 @@
+import gzip
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+
+from . import codec, config, exceptions
+
+SUFFIX = '.json.gz'
+
+
+class DeadLetterStore(object):
+    """
+    Stores messages and results which were rejected so they can be replayed
+    later.
+
+    Records are stored in "<directory>/<error class>/<message ID>.json.gz"
+    as compressed JSON lines. Each file is appended to if a message is
+    rejected multiple times (e.g. for each result in a batch).
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (string) - Directory for stored records
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def store(self, msg, error, payload=None):
+        """
+        Stores rejected message and result payload.
+
+        Args:
+            msg (Message) - Rejected message
+            error (Exception) - Error rejecting the message
+            payload (string) - Result payload, taken from error if available
+        """
+        if payload is None:
+            payload = getattr(error, 'payload', None)
+
+        record = {
+            'msg_id': msg.msg_id,
+            'error': str(error),
+            'time': time.time(),
+            'message': msg.msg_data,
+            'payload': None if payload is None else str(payload),
+        }
+        data = codec.dumps(record, default=str) + '\n'
+
+        path = self.path(type(error).__name__, msg.msg_id)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Appending creates a multi-member gzip file which reads as one.
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                f.write(data)
+
+    def path(self, error_class, msg_id):
+        return os.path.join(
+            self.directory, error_class, quote(msg_id, safe='') + SUFFIX)
+
+    def find(self, error_classes=None, msg_ids=None):
+        """
+        Returns list of (error class, message ID, path) tuples of stored
+        records, optionally only for given error classes and message IDs.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+
+        entries = []
+        for error_class in sorted(os.listdir(self.directory)):
+            if error_classes and error_class not in error_classes:
+                continue
+
+            error_dir = os.path.join(self.directory, error_class)
+            for name in sorted(os.listdir(error_dir)):
+                if not name.endswith(SUFFIX):
+                    continue
+
+                msg_id = unquote(name[:-len(SUFFIX)])
+                if msg_ids and msg_id not in msg_ids:
+                    continue
+
+                entries.append((error_class, msg_id, os.path.join(error_dir, name)))
+
+        return entries
+
+    @staticmethod
+    def load(path):
+        """
+        Returns records stored in a file.
+        """
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [codec.loads(line) for line in f if line.strip()]
+
+    def rewrite(self, path, records):
+        """
+        Replaces records stored in a file.
+        """
+        data = ''.join(codec.dumps(record, default=str) + '\n' for record in records)
+        tmp_path = path + '.tmp'
+        with self._lock:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def remove(self, path):
+        with self._lock:
+            os.remove(path)
+
+
+# Rejected messages and results for later replay.
+DEAD_LETTERS = None
+if config.DEAD_LETTER_DIR:
+    DEAD_LETTERS = DeadLetterStore(config.DEAD_LETTER_DIR)
+
+
+def store_dead_letter(msg, error, payload=None):
+    """
+    Stores rejected message if dead-letter directory is configured.
+    """
+    if DEAD_LETTERS is None:
+        return
+
+    try:
+        DEAD_LETTERS.store(msg, error, payload)
+    except Exception:
+        msg.log.exception('Failed to store rejected message')
+
+
+def handle_error(msg, error, payload=None):
+    """
+    Logs error from processing a message or posting its result and stores
+    rejected messages.
+
+    Messages not processed because ResultsDB is unavailable are stored too
+    (only the result payload if posting it failed), unless the result is
+    kept in the spool.
+
+    Used where errors must not propagate: fedmsg would NACK the message and
+    worker threads would die.
+    """
+    if isinstance(error, exceptions.CreateResultError):
+        msg.log.error('Failed to process message: %s', error)
+        store_dead_letter(msg, error)
+    elif isinstance(error, exceptions.CircuitOpenError):
+        msg.log.error('Failed to process message: %s', error)
+        if payload is None:
+            payload = error.payload
+        if getattr(payload, 'spool_id', None) is None:
+            store_dead_letter(msg, error, payload)
+    elif isinstance(error, exceptions.InvalidMessageError):
+        msg.log.warning('Invalid message rejected: %s', error)
+        store_dead_letter(msg, error)
+    else:
+        msg.log.exception('Unexpected exception', exc_info=error)
@@ -56,3 +56,21 @@ class CreateResultError(RuntimeError):
 
     def __str__(self):
         return 'Failed to create result: {0}; Payload: {1}'.format(self.msg, self.payload)
+
+
+class RetryQueueFullError(RuntimeError):
+    def __str__(self):
+        return 'Result was dropped because the retry queue is full'
+
+
+class RetryQueueStoppedError(RuntimeError):
+    def __str__(self):
+        return 'Result was waiting for retry when the service stopped'
+
+
+class CircuitOpenError(RuntimeError):
+    # Result payload which was not posted, if known
+    payload = None
+
+    def __str__(self):
+        return 'ResultsDB is unavailable (circuit breaker is open)'
@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import time
+
+# Number of updates after which old entries are pruned.
+PRUNE_INTERVAL = 100
+
+
+class GroupIndex(object):
+    """
+    Persistent index of group UUIDs by description stored in SQLite.
+
+    Keeps groups known to the service across restarts so they don't need to
+    be queried from ResultsDB again. Entries older than max_age are ignored
+    and, together with the oldest entries exceeding max_entries, pruned.
+    """
+
+    def __init__(self, path, max_entries, max_age, timer=time.time):
+        """
+        Args:
+            path (string) - Path to the SQLite database file
+            max_entries (int) - Maximum number of entries kept
+            max_age (float) - Number of seconds after which entries expire
+            timer (callable) - Returns current time in seconds
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.timer = timer
+        self._updates = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS groups ('
+            'description TEXT PRIMARY KEY, uuid TEXT NOT NULL, updated REAL NOT NULL)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS groups_updated ON groups (updated)')
+        self.prune()
+
+    def get(self, description):
+        """
+        Returns group UUID or None if not found or expired.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT uuid FROM groups WHERE description = ? AND updated > ?',
+                (description, self.timer() - self.max_age)).fetchone()
+        return row[0] if row else None
+
+    def set(self, description, group_uuid):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO groups (description, uuid, updated) VALUES (?, ?, ?)',
+                (description, group_uuid, self.timer()))
+            self._updates += 1
+            if self._updates % PRUNE_INTERVAL == 0:
+                self._prune()
+
+    def prune(self):
+        with self._lock:
+            self._prune()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM groups').fetchone()[0]
+
+    def _prune(self):
+        self._db.execute(
+            'DELETE FROM groups WHERE updated <= ?', (self.timer() - self.max_age,))
+        self._db.execute(
+            'DELETE FROM groups WHERE description IN ('
+            'SELECT description FROM groups ORDER BY updated DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,))
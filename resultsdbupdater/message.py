@@ -1,3 +1,5 @@
+import functools
+
 import semantic_version
 
 from . import config
@@ -5,6 +7,58 @@ from . import exceptions
 
 REQUIRED_FIELD = object()
 
+# Value of a memoized attribute which was not computed yet.
+_UNSET = object()
+
+
+def _get_path(path):
+    def get(value, default):
+        for key in path:
+            if not isinstance(value, dict):
+                return default
+            value = value.get(key, default)
+        return value
+
+    return get
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_path(path):
+    """
+    Returns function getting value at given path of keys in nested dicts.
+
+    The returned function is called with (value, default) and returns the
+    default if any value on the path is not a dict or is missing.
+
+    Args:
+        path (tuple) - Keys for each level of nested dicts
+    """
+    # Unrolled for the most common paths.
+    if len(path) == 1:
+        key, = path
+
+        def get(value, default):
+            if not isinstance(value, dict):
+                return default
+            return value.get(key, default)
+
+        return get
+
+    if len(path) == 2:
+        key1, key2 = path
+
+        def get(value, default):
+            if not isinstance(value, dict):
+                return default
+            value = value.get(key1, default)
+            if not isinstance(value, dict):
+                return default
+            return value.get(key2, default)
+
+        return get
+
+    return _get_path(path)
+
 
 def get_body(msg):
     return msg.get('body', {}).get('msg')
@@ -19,23 +73,28 @@ class Result(object):
     Provides test result data from message.
     """
 
+    __slots__ = ('msg', '_testcase')
+
     def __init__(self, msg):
         """
         Args:
             msg (Message) - Parent message
         """
         self.msg = msg
+        self._testcase = _UNSET
 
-    def get(self, *args, **kwargs):
-        return self.msg.get(*args, **kwargs)
+    def get(self, *args, default=REQUIRED_FIELD):
+        return self.msg.get(*args, default=default)
 
     @property
     def version(self):
-        return get_version(self.msg)
+        return self.msg.version
 
     @property
     def testcase(self):
-        return '.'.join((self.namespace, self.type, self.category))
+        if self._testcase is _UNSET:
+            self._testcase = '.'.join((self.namespace, self.type, self.category))
+        return self._testcase
 
     @property
     def category(self):
@@ -67,8 +126,10 @@ class Result(object):
 
 
 class ResultV2(Result):
-    def get(self, *args, **kwargs):
-        return self.msg.get('test', *args, **kwargs)
+    __slots__ = ()
+
+    def get(self, *args, default=REQUIRED_FIELD):
+        return self.msg.get('test', *args, default=default)
 
     @property
     def xunit(self):
@@ -87,24 +148,26 @@ class PrefixLogger(object):
     Wrapper around a logger, adds custom prefix to messages.
     """
 
+    __slots__ = ('prefix', 'log')
+
     def __init__(self, prefix, log):
         self.prefix = prefix
         self.log = log
 
-    def info(self, msg, *args):
-        self.log.info(self._prefixed(msg), *args)
+    def info(self, msg, *args, **kwargs):
+        self.log.info(self._prefixed(msg), *args, **kwargs)
 
-    def warning(self, msg, *args):
-        self.log.warning(self._prefixed(msg), *args)
+    def warning(self, msg, *args, **kwargs):
+        self.log.warning(self._prefixed(msg), *args, **kwargs)
 
-    def error(self, msg, *args):
-        self.log.error(self._prefixed(msg), *args)
+    def error(self, msg, *args, **kwargs):
+        self.log.error(self._prefixed(msg), *args, **kwargs)
 
-    def exception(self, msg, *args):
-        self.log.exception(self._prefixed(msg), *args)
+    def exception(self, msg, *args, **kwargs):
+        self.log.exception(self._prefixed(msg), *args, **kwargs)
 
-    def debug(self, msg, *args):
-        self.log.debug(self._prefixed(msg), *args)
+    def debug(self, msg, *args, **kwargs):
+        self.log.debug(self._prefixed(msg), *args, **kwargs)
 
     def _prefixed(self, msg):
         return '[{0}]: {1}'.format(self.prefix, msg)
@@ -113,56 +176,61 @@ class PrefixLogger(object):
 class Message(object):
     """
     Provides message data.
+
+    Values derived from the message data are computed on first access and
+    cached, so the message data must not be modified afterwards.
     """
 
+    __slots__ = (
+        'msg_data', 'msg_id', 'topic', 'log', 'trace', '_body', '_version', '_result',
+        '_contact_dict')
+
+    # Result class for the message format version
+    result_class = Result
+
     def __init__(self, msg_data):
         """
         Args:
             msg (dict) - Message data
         """
         self.msg_data = msg_data
+        try:
+            self.msg_id = self.header('message-id')
+        except Exception:
+            self.msg_id = 'ID:UNKNOWN'
+        try:
+            self.topic = msg_data.get('topic')
+        except Exception:
+            self.topic = None
         self.log = PrefixLogger(self.msg_id, config.LOGGER)
+        # Set by tracing.trace() when the message is consumed.
+        self.trace = None
+        self._body = _UNSET
+        self._version = _UNSET
+        self._result = None
+        self._contact_dict = None
 
     def __repr__(self):
         return repr(self.msg_data)
 
     @property
     def body(self):
-        return get_body(self.msg_data)
-
-    @property
-    def msg_id(self):
-        try:
-            return self.header('message-id')
-        except Exception:
-            return 'ID:UNKNOWN'
-
-    @property
-    def topic(self):
-        return self.msg_data.get('topic')
+        if self._body is _UNSET:
+            # Non-dict message data has no body and is dropped.
+            self._body = compile_path(('body', 'msg'))(self.msg_data, None)
+        return self._body
 
     @property
     def version(self):
-        return get_version(self.msg_data)
+        if self._version is _UNSET:
+            self._version = self.body.get('version', '0.1.0')
+        return self._version
 
     def header(self, name):
         return self.msg_data.get('headers', {}).get(name)
 
-    def _get(self, *args, **kwargs):
-        value = kwargs.get('value')
-        default = kwargs.get('default')
-
-        for arg in args:
-            if not isinstance(value, dict):
-                return default
-            value = value.get(arg, default)
-
-        return value
-
-    def get(self, *args, **kwargs):
-        default = kwargs.get('default', REQUIRED_FIELD)
-
-        value = self._get(*args, value=self.body, default=default)
+    def get(self, *args, default=REQUIRED_FIELD):
+        value = compile_path(args)(self.body, default)
 
         if value is REQUIRED_FIELD:
             raise exceptions.MissingMessageField(*args)
@@ -180,7 +248,7 @@ class Message(object):
         if isinstance(system, list):
             system = system[0] if system else {}
 
-        value = self._get(field, value=system, default=default)
+        value = compile_path((field,))(system, default)
 
         if value is REQUIRED_FIELD:
             raise exceptions.MissingMessageField('system', field)
@@ -189,17 +257,21 @@ class Message(object):
 
     @property
     def result(self):
-        return Result(self)
+        if self._result is None:
+            self._result = self.result_class(self)
+        return self._result
 
     @property
     def contact_dict(self):
-        return {
-            'ci_name': self.contact('name'),
-            'ci_team': self.contact('team'),
-            'ci_url': self.contact('url', default='not available'),
-            'ci_irc': self.contact('irc', default='not available'),
-            'ci_email': self.contact('email'),
-        }
+        if self._contact_dict is None:
+            self._contact_dict = {
+                'ci_name': self.contact('name'),
+                'ci_team': self.contact('team'),
+                'ci_url': self.contact('url', default='not available'),
+                'ci_irc': self.contact('irc', default='not available'),
+                'ci_email': self.contact('email'),
+            }
+        return self._contact_dict
 
     @property
     def recipients(self):
@@ -211,9 +283,9 @@ class Message(object):
 
 
 class MessageV2(Message):
-    @property
-    def result(self):
-        return ResultV2(self)
+    __slots__ = ()
+
+    result_class = ResultV2
 
     @property
     def recipients(self):
@@ -225,22 +297,67 @@ class MessageV2(Message):
 
 
 class MessageV2_1(MessageV2):
+    __slots__ = ()
+
     def contact(self, field, default=REQUIRED_FIELD):
         return self.get('contact', field, default=default)
 
 
-def create_message(msg_data):
+# Maximum number of cached message classes by version. Only a few distinct
+# versions are expected in messages.
+MESSAGE_CLASS_CACHE_SIZE = 64
+
+# Message classes by version, None for versions which failed to parse.
+_message_classes = {}
+
+
+def _resolve_message_class(version):
+    if semantic_version.match('<0.2.0', version):
+        return Message
+
+    if semantic_version.match('<0.2.1', version):
+        return MessageV2
+
+    return MessageV2_1
+
+
+def get_message_class(version):
+    """
+    Returns message class for given message format version.
+
+    Raises ValueError if the version cannot be parsed.
+    """
+    try:
+        message_class = _message_classes[version]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable version value
+        return _resolve_message_class(version)
+    else:
+        if message_class is None:
+            raise ValueError('Invalid version {0!r}'.format(version))
+        return message_class
+
+    if len(_message_classes) >= MESSAGE_CLASS_CACHE_SIZE:
+        _message_classes.clear()
+
     try:
-        version = get_version(msg_data)
+        message_class = _resolve_message_class(version)
+    except Exception:
+        _message_classes[version] = None
+        raise
 
-        if semantic_version.match('<0.2.0', version):
-            return Message(msg_data)
+    _message_classes[version] = message_class
+    return message_class
 
-        if semantic_version.match('<0.2.1', version):
-            return MessageV2(msg_data)
 
-        return MessageV2_1(msg_data)
+def create_message(msg_data):
+    try:
+        message_class = get_message_class(get_version(msg_data))
     except Exception:
         msg = Message(msg_data)
         msg.log.exception('Failed to parse message version')
         return msg
+
+    return message_class(msg_data)
@@ -0,0 +1,321 @@
+"""
+Metrics exposed in Prometheus text format.
+
+See: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds of histogram buckets in seconds.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of latency histogram buckets in seconds.
+LATENCY_BUCKETS = (
+    0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# All metrics in the order they are exposed.
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    metric_type = None
+
+    def __init__(self, name, description, labels=(), registry=REGISTRY):
+        """
+        Args:
+            name (string) - Metric name
+            description (string) - Metric description
+            labels (tuple) - Label names
+            registry (list) - Metrics to add the new metric to
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.description),
+            '# TYPE {0} {1}'.format(self.name, self.metric_type),
+        ]
+        lines.extend(self._samples())
+        return '\n'.join(lines) + '\n'
+
+    def _samples(self):
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    """
+    Thread-safe counter with separate values for each combination of label
+    values.
+    """
+
+    metric_type = 'counter'
+
+    def __init__(self, name, description, labels=(), registry=REGISTRY):
+        super(Counter, self).__init__(name, description, labels, registry)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def values(self):
+        """
+        Returns dict with values by tuple of label values.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        values = self.values()
+        if not values and not self.labels:
+            values = {(): 0}
+        return [
+            '{0}{1} {2}'.format(self.name, _format_labels(self.labels, key), _format_value(value))
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    """
+    Gauge with values computed by functions when metrics are collected.
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, description, labels=(), registry=REGISTRY):
+        super(Gauge, self).__init__(name, description, labels, registry)
+        self._functions = {}
+
+    def set_function(self, fn, *label_values):
+        """
+        Sets function returning current value for given label values.
+        """
+        with self._lock:
+            self._functions[label_values] = fn
+
+    def remove(self, *label_values):
+        with self._lock:
+            self._functions.pop(label_values, None)
+
+    def _samples(self):
+        with self._lock:
+            functions = sorted(self._functions.items())
+        return [
+            '{0}{1} {2}'.format(self.name, _format_labels(self.labels, key), _format_value(fn()))
+            for key, fn in functions
+        ]
+
+
+class FunctionCounter(Gauge):
+    """
+    Counter with values computed by functions when metrics are collected,
+    for counts kept by other objects.
+    """
+
+    metric_type = 'counter'
+
+
+class Histogram(Metric):
+    """
+    Thread-safe histogram of observed values.
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        super(Histogram, self).__init__(name, description, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+        # Bucket counts (non-cumulative, last one for +Inf), sum and count by
+        # label values.
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            data[0][index] += 1
+            data[1] += value
+            data[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        """
+        Observes duration of the with-statement body in seconds.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, *label_values)
+
+    def count(self, *label_values):
+        with self._lock:
+            data = self._values.get(label_values)
+            return 0 if data is None else data[2]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(
+                (key, (list(data[0]), data[1], data[2])) for key, data in self._values.items())
+
+        samples = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append('{0}_bucket{1} {2}'.format(
+                    self.name,
+                    _format_labels(self.labels, key, [('le', _format_value(bound))]),
+                    cumulative))
+            labels = _format_labels(self.labels, key)
+            samples.append('{0}_sum{1} {2}'.format(self.name, labels, _format_value(total)))
+            samples.append('{0}_count{1} {2}'.format(self.name, labels, count))
+        return samples
+
+
+def render(registry=REGISTRY):
+    """
+    Returns all metrics in Prometheus text format.
+    """
+    return ''.join(metric.render() for metric in registry)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Don't log each scrape.
+        pass
+
+
+def start_http_server(port, address=''):
+    """
+    Starts HTTP server exposing metrics from a background thread.
+
+    Returns the server, call shutdown() and server_close() to stop it.
+    """
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='MetricsServer')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# Received messages by route (see consumer.classify_message()).
+MESSAGES = Counter(
+    'resultsdb_updater_messages_total', 'Messages received by route', ('route',))
+
+# Time spent processing a message in the consumer.
+MESSAGE_DURATION = Histogram(
+    'resultsdb_updater_message_duration_seconds', 'Time spent processing a message')
+
+# Prepared results by artifact type and outcome (see
+# utils.result_metric_labels()).
+RESULTS = Counter(
+    'resultsdb_updater_results_total', 'Results prepared by artifact type and outcome',
+    ('type', 'outcome'))
+
+# Time from publishing a message to receiving it in the consumer.
+CONSUMER_LAG = Histogram(
+    'resultsdb_updater_consumer_lag_seconds', 'Time from publishing message to consuming it',
+    buckets=LATENCY_BUCKETS)
+
+# Time from consuming a message to a result accepted by ResultsDB.
+RESULT_LATENCY = Histogram(
+    'resultsdb_updater_result_latency_seconds',
+    'Time from consuming message to result accepted by ResultsDB',
+    buckets=LATENCY_BUCKETS)
+
+# Latency of ResultsDB requests.
+REQUEST_DURATION = Histogram(
+    'resultsdb_updater_request_duration_seconds', 'ResultsDB request latency by operation',
+    ('operation',))
+
+# Results posted again from the retry queue.
+RETRIES = Counter(
+    'resultsdb_updater_retries_total', 'Attempts to post result from retry queue')
+
+# Results waiting in queues.
+QUEUE_SIZE = Gauge(
+    'resultsdb_updater_queue_size', 'Results waiting in queue', ('queue',))
+
+# State of the circuit breaker (1 for the current state, 0 for others).
+CIRCUIT_BREAKER_STATE = Gauge(
+    'resultsdb_updater_circuit_breaker_state', 'Circuit breaker state', ('state',))
+
+# Times the circuit breaker opened.
+CIRCUIT_BREAKER_OPENED = FunctionCounter(
+    'resultsdb_updater_circuit_breaker_opened_total', 'Times circuit breaker opened')
+
+# Requests rejected while the circuit breaker was open.
+CIRCUIT_BREAKER_REJECTED = FunctionCounter(
+    'resultsdb_updater_circuit_breaker_rejected_total',
+    'Requests rejected by open circuit breaker')
+
+# Group cache lookups by result ("hit" or "miss").
+GROUP_CACHE_LOOKUPS = FunctionCounter(
+    'resultsdb_updater_group_cache_lookups_total', 'Group cache lookups by result',
+    ('result',))
+
+# Time spent in message processing stages, excluding nested stages (only if
+# timing.observe_metrics is in timing_hooks option).
+STAGE_DURATION = Histogram(
+    'resultsdb_updater_stage_duration_seconds', 'Time spent in message processing stage',
+    ('stage',))
+
+# Bytes removed from result data values too large for ResultsDB.
+CROPPED_BYTES = Counter(
+    'resultsdb_updater_cropped_bytes_total', 'Bytes cropped from result data')
@@ -0,0 +1,74 @@
+import queue
+import threading
+
+from . import utils
+from .deadletter import handle_error
+
+# Queue item which makes a worker thread quit.
+_STOP = object()
+
+
+class ResultPipeline(object):
+    """
+    Posts prepared results to ResultsDB from a pool of worker threads.
+
+    The queue is bounded so a slow ResultsDB blocks consuming new messages
+    instead of growing the memory usage without limit.
+    """
+
+    def __init__(self, workers, queue_size, post=None):
+        """
+        Args:
+            workers (int) - Number of worker threads
+            queue_size (int) - Maximum number of results waiting in the queue
+            post (callable) - Posts result, called with (msg, payload);
+                utils.post_result() by default
+        """
+        self.post = post or utils.post_result
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = [
+            threading.Thread(
+                target=self._work, name='ResultPipeline-{0}'.format(i))
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.daemon = True
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, msg, payload):
+        self.queue.put((msg, payload))
+
+    def join(self):
+        """
+        Blocks until all queued results are processed.
+        """
+        self.queue.join()
+
+    def stop(self):
+        """
+        Processes all queued results and stops worker threads.
+        """
+        for _ in self.threads:
+            self.queue.put(_STOP)
+
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._post(*item)
+            finally:
+                self.queue.task_done()
+
+    def _post(self, msg, payload):
+        try:
+            self.post(msg, payload)
+        except Exception as e:
+            handle_error(msg, e, payload)
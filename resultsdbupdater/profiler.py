@@ -0,0 +1,147 @@
+"""
+On-demand sampling profiler for a running consumer.
+
+Nothing is recorded until the profiler is started (e.g. with a signal, see
+profile_* options). Then stacks of all threads are sampled for a given
+duration and written as collapsed stacks (one "thread;frame;...;frame count"
+line per stack, the input format of flamegraph.pl), optionally with a
+tracemalloc snapshot of memory allocated and not freed during that time.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from . import config
+
+
+def _frame_label(code, labels):
+    label = labels.get(code)
+    if label is None:
+        label = labels[code] = '{0} ({1}:{2})'.format(
+            code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+    return label
+
+
+def collapse_stack(thread_name, frame, labels):
+    """
+    Returns stack of a frame as "thread;outermost;...;innermost".
+
+    Args:
+        thread_name (string) - Name of the thread running the frame
+        frame (frame) - Innermost frame
+        labels (dict) - Cache for frame labels by code object
+    """
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code, labels))
+        frame = frame.f_back
+    stack.append(thread_name.replace(';', ':'))
+    stack.reverse()
+    return ';'.join(stack)
+
+
+class Profiler(object):
+    """
+    Samples stacks of all threads from a background thread.
+    """
+
+    def __init__(self, directory, duration=30, interval=0.01, trace_malloc=False):
+        """
+        Args:
+            directory (string) - Directory for output files
+            duration (float) - Number of seconds to profile for
+            interval (float) - Seconds between samples
+            trace_malloc (bool) - Also write tracemalloc snapshot
+        """
+        self.directory = directory
+        self.duration = duration
+        self.interval = interval
+        self.trace_malloc = trace_malloc
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts profiling unless it's already in progress.
+
+        Returns False if profiling is already in progress.
+        """
+        # Called from signal handler, so don't wait for the lock.
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        try:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+
+            self._thread = threading.Thread(target=self._run, name='Profiler')
+            self._thread.daemon = True
+            self._thread.start()
+            return True
+        finally:
+            self._lock.release()
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._profile()
+        except Exception:
+            config.LOGGER.exception('Profiling failed')
+
+    def _profile(self):
+        config.LOGGER.info('Profiling for %s seconds', self.duration)
+        started_tracemalloc = self.trace_malloc and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(25)
+
+        try:
+            stacks, samples = self.sample()
+            snapshot = tracemalloc.take_snapshot() if self.trace_malloc else None
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(
+            self.directory, '{0}-{1}'.format(time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+
+        path = prefix + '.collapsed'
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write('{0} {1}\n'.format(stack, count))
+        config.LOGGER.info('Wrote %s samples to %s', samples, path)
+
+        if snapshot is not None:
+            path = prefix + '.tracemalloc'
+            snapshot.dump(path)
+            config.LOGGER.info('Wrote tracemalloc snapshot to %s', path)
+
+    def sample(self):
+        """
+        Samples stacks of other threads for the profiling duration.
+
+        Returns collections.Counter of collapsed stacks and number of
+        samples.
+        """
+        stacks = collections.Counter()
+        labels = {}
+        own_ident = threading.get_ident()
+        samples = 0
+        deadline = time.monotonic() + self.duration
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    stacks[collapse_stack(names.get(ident, str(ident)), frame, labels)] += 1
+            samples += 1
+
+            if time.monotonic() + self.interval >= deadline:
+                return stacks, samples
+            time.sleep(self.interval)
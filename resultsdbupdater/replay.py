@@ -0,0 +1,119 @@
+"""
+Replays messages and results stored in dead-letter directory.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import sys
+
+from . import config, utils
+from .consumer import handle_message
+from .deadletter import DeadLetterStore
+from .message import Message, create_message
+
+
+def replay_file(path, reprocess=False, store=None):
+    """
+    Posts results stored in a dead-letter file to ResultsDB.
+
+    Messages stored without result payload (rejected as invalid) or all
+    messages if reprocess is True are processed again from scratch.
+
+    If posting some of the results fails, the remaining ones are still
+    posted and the first error is raised. If store is given, only the
+    failed results are kept in the file so the accepted ones are not posted
+    again by the next replay.
+
+    Raises exception on failure.
+    """
+    records = DeadLetterStore.load(path)
+    if reprocess or any(record['payload'] is None for record in records):
+        handle_message(create_message(records[0]['message']))
+        return
+
+    msg = Message(records[0]['message'])
+    failed = []
+    for record in records:
+        try:
+            utils.post_result(msg, record['payload'])
+        except Exception as e:
+            failed.append((e, record))
+
+    if failed:
+        if store is not None and len(failed) < len(records):
+            store.rewrite(path, [record for _, record in failed])
+        raise failed[0][0]
+
+
+def replay(store, entries, workers, reprocess=False, keep=False):
+    """
+    Replays given dead-letter entries in parallel.
+
+    Successfully replayed entries are removed unless keep is True.
+
+    Returns list of failed entries.
+    """
+    def replay_entry(entry):
+        error_class, msg_id, path = entry
+        try:
+            replay_file(path, reprocess, None if keep else store)
+        except Exception as e:
+            config.LOGGER.error('Failed to replay %s (%s): %s', msg_id, error_class, e)
+            return False
+
+        config.LOGGER.info('Replayed %s (%s)', msg_id, error_class)
+        if not keep:
+            store.remove(path)
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(replay_entry, entries))
+
+    return [entry for entry, ok in zip(entries, results) if not ok]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        '--dir', default=config.DEAD_LETTER_DIR,
+        help='dead-letter directory (default: %(default)s)')
+    parser.add_argument(
+        '--error', action='append', metavar='CLASS',
+        help='replay only messages rejected with given error class')
+    parser.add_argument(
+        '--message-id', action='append', metavar='ID',
+        help='replay only given message')
+    parser.add_argument(
+        '--workers', type=int, default=8,
+        help='number of parallel requests (default: %(default)s)')
+    parser.add_argument(
+        '--reprocess', action='store_true',
+        help='process messages again instead of posting stored results')
+    parser.add_argument(
+        '--keep', action='store_true',
+        help='do not remove successfully replayed messages')
+    parser.add_argument(
+        '--list', action='store_true',
+        help='only list stored messages')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(sys.argv[1:] if args is None else args)
+    if not args.dir:
+        print('Dead-letter directory is not configured', file=sys.stderr)
+        return 2
+
+    store = DeadLetterStore(args.dir)
+    entries = store.find(args.error, args.message_id)
+    if args.list:
+        for error_class, msg_id, _ in entries:
+            print('{0}\t{1}'.format(error_class, msg_id))
+        return 0
+
+    failed = replay(store, entries, args.workers, args.reprocess, args.keep)
+    print('Replayed {0} of {1} messages'.format(len(entries) - len(failed), len(entries)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import config, exceptions, metrics
+from .deadletter import handle_error, store_dead_letter
+
+RETRIABLE_ERRORS = (
+    exceptions.CircuitOpenError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.RetryError,
+    requests.exceptions.Timeout,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+if aiohttp is not None:
+    RETRIABLE_ERRORS += (aiohttp.ClientConnectionError,)
+
+
+def is_retriable(error):
+    """
+    Returns True if posting a result can succeed later after given error,
+    i.e. on connection errors, timeouts and server errors.
+    """
+    if isinstance(error, RETRIABLE_ERRORS):
+        return True
+
+    # HTTP errors from requests and aiohttp
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+    return isinstance(status, int) and status >= 500
+
+
+class RetryQueue(object):
+    """
+    Retries posting failed results from a background thread.
+
+    Results are scheduled by time with exponential backoff, so other
+    messages keep flowing while ResultsDB is unavailable.
+    """
+
+    def __init__(self, post, max_attempts, backoff_factor, max_backoff, maxsize,
+                 timer=time.monotonic):
+        """
+        Args:
+            post (callable) - Posts result, called with (msg, payload)
+            max_attempts (int) - Maximum number of attempts to post a result
+            backoff_factor (float) - Delay in seconds before the first retry,
+                doubled for each next retry
+            max_backoff (float) - Maximum delay in seconds between retries
+            maxsize (int) - Maximum number of results waiting for retry
+            timer (callable) - Returns current time in seconds
+        """
+        self.post = post
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.maxsize = maxsize
+        self.timer = timer
+        self.retries = 0
+        self._heap = []
+        self._counter = itertools.count()
+        self._stopped = False
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(target=self._work, name='RetryQueue')
+        self.thread.daemon = True
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread.
+
+        Results waiting for retry are logged and stored in dead-letter
+        directory, except results kept in the spool which are posted again
+        after restart.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.thread.join()
+
+        with self._condition:
+            dropped, self._heap = self._heap, []
+
+        if dropped:
+            config.LOGGER.warning('Dropping %s results waiting for retry', len(dropped))
+
+        for _, _, _, msg, payload in sorted(dropped, key=lambda item: item[1]):
+            msg.log.error('Result not posted before stop: %s', payload)
+            self._store_dropped(msg, payload, exceptions.RetryQueueStoppedError())
+
+    def delay(self, attempt):
+        """
+        Returns number of seconds to wait before given attempt.
+        """
+        return min(self.backoff_factor * 2 ** (attempt - 2), self.max_backoff)
+
+    def submit(self, msg, payload):
+        """
+        Posts result and schedules retry if it fails with retriable error.
+        """
+        self._attempt(msg, payload, attempt=1)
+
+    def put(self, msg, payload, attempt=2):
+        """
+        Schedules given attempt to post result.
+        """
+        with self._condition:
+            full = len(self._heap) >= self.maxsize
+            if not full:
+                due = self.timer() + self.delay(attempt)
+                heapq.heappush(
+                    self._heap, (due, next(self._counter), attempt, msg, payload))
+                self._condition.notify()
+
+        if full:
+            msg.log.error('Retry queue is full, dropping result: %s', payload)
+            self._store_dropped(msg, payload, exceptions.RetryQueueFullError())
+
+    def retry_later(self, msg, payload, error, attempt=1):
+        """
+        Schedules next attempt to post result after given failed attempt.
+
+        Returns False if the error is not retriable.
+        """
+        if not is_retriable(error):
+            return False
+
+        if attempt >= self.max_attempts:
+            msg.log.error(
+                'Giving up posting result after %s attempts (%r): %s',
+                attempt, error, payload)
+            self._store_dropped(msg, payload, error)
+            return True
+
+        msg.log.warning(
+            'Failed to post result (%r), retry %s of %s scheduled',
+            error, attempt, self.max_attempts - 1)
+        self.put(msg, payload, attempt + 1)
+        return True
+
+    def _store_dropped(self, msg, payload, error):
+        """
+        Stores dropped result in dead-letter directory unless it's kept in
+        the spool to be posted again after restart.
+        """
+        if getattr(payload, 'spool_id', None) is None:
+            store_dead_letter(msg, error, payload)
+
+    def _attempt(self, msg, payload, attempt):
+        try:
+            self.post(msg, payload)
+        except Exception as e:
+            if not self.retry_later(msg, payload, e, attempt):
+                raise
+
+    def _next(self):
+        with self._condition:
+            while not self._stopped:
+                if self._heap:
+                    timeout = self._heap[0][0] - self.timer()
+                    if timeout <= 0:
+                        return heapq.heappop(self._heap)
+                else:
+                    timeout = None
+                self._condition.wait(timeout)
+        return None
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+
+            _, _, attempt, msg, payload = item
+            self.retries += 1
+            metrics.RETRIES.inc()
+            try:
+                self._attempt(msg, payload, attempt)
+            except Exception as e:
+                handle_error(msg, e, payload)
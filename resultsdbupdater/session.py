@@ -5,19 +5,22 @@ from requests.packages.urllib3.util.retry import Retry
 from . import config
 
 
-def _retry_session():
-    # This will give the total wait time in minutes:
+def _retry_session(retries):
+    # This will give the total wait time in minutes for 24 retries:
     # >>> sum([min((0.3 * (2 ** (i - 1))), 120) / 60 for i in range(24)])
     # >>> 30.5575
     # This works by the using the minimum time in seconds of the backoff time
     # and the max back off time which defaults to 120 seconds. The backoff time
     # increases after every failed attempt.
+    #
+    # Failed results are retried later instead if the retry queue is enabled,
+    # so only few retries should be configured in that case.
     session = requests.Session()
     retry = Retry(
-        total=24,
-        read=24,
-        connect=24,
-        status=24,
+        total=retries,
+        read=retries,
+        connect=retries,
+        status=retries,
         backoff_factor=0.3,
         status_forcelist=(500, 502, 504),
         method_whitelist=('GET', 'POST'),
@@ -33,4 +36,4 @@ def _retry_session():
     return session
 
 
-session = _retry_session()
+session = _retry_session(config.SESSION_RETRIES)
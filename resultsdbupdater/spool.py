@@ -0,0 +1,275 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from . import codec, exceptions
+from .retry import is_retriable
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+
+
+class SpooledPayload(str):
+    """
+    Result payload with ID of its record in the spool.
+    """
+    spool_id = None
+
+
+def _segment_name(number):
+    return '{0}{1:08d}{2}'.format(SEGMENT_PREFIX, number, SEGMENT_SUFFIX)
+
+
+def _segment_number(name):
+    if not name.startswith(SEGMENT_PREFIX) or not name.endswith(SEGMENT_SUFFIX):
+        return None
+    try:
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+    except ValueError:
+        return None
+
+
+class Spool(object):
+    """
+    Durable append-only log of results waiting to be posted to ResultsDB.
+
+    Each prepared result is appended to the spool before it's posted and
+    marked done after ResultsDB accepts or rejects it. Results not marked
+    done (e.g. after a crash or restart) are available from pending().
+
+    Records are written to segment files; a new segment is started once
+    the current one reaches segment_size bytes. The oldest segments are
+    removed once all their results are done. If there are more than
+    max_segments segments, results still pending in the oldest segment are
+    copied to the current one so the old segment can be removed.
+
+    Writes are flushed immediately but synced to disk at most once per
+    fsync_interval seconds. Writes not synced by a later write are synced
+    from a timer thread, so each write is synced within fsync_interval
+    seconds.
+    """
+
+    def __init__(self, directory, segment_size, max_segments, fsync_interval,
+                 timer=time.monotonic):
+        """
+        Args:
+            directory (string) - Directory for segment files
+            segment_size (int) - Size in bytes after which new segment starts
+            max_segments (int) - Number of segments triggering compaction
+            fsync_interval (float) - Seconds between syncs to disk
+            timer (callable) - Returns current time in seconds
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.fsync_interval = fsync_interval
+        self.timer = timer
+        self._lock = threading.Lock()
+        # Pending record IDs by segment number
+        self._segments = OrderedDict()
+        # Pending records by ID
+        self._records = OrderedDict()
+        self._next_id = 1
+        self._file = None
+        self._last_sync = timer()
+        # Pending threading.Timer syncing unsynced writes
+        self._sync_timer = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._pending_on_start = list(self._records)
+        self._start_segment()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def pending(self):
+        """
+        Returns payloads which were not done when the spool was opened.
+        """
+        with self._lock:
+            return [
+                (self._records[record_id]['msg_id'], self._payload(self._records[record_id]))
+                for record_id in self._pending_on_start
+                if record_id in self._records
+            ]
+
+    def append(self, msg_id, payload):
+        """
+        Appends result payload and returns it as SpooledPayload.
+        """
+        with self._lock:
+            record = {'id': self._next_id, 'msg_id': msg_id, 'payload': payload}
+            self._next_id += 1
+            self._add(record)
+            self._rotate_if_needed()
+            self._sync_if_needed()
+            return self._payload(record)
+
+    def done(self, payload):
+        """
+        Marks spooled result payload as done.
+        """
+        record_id = getattr(payload, 'spool_id', None)
+        if record_id is None:
+            return
+
+        with self._lock:
+            record = self._records.pop(record_id, None)
+            if record is None:
+                return
+
+            segment = self._segments[record['segment']]
+            segment.discard(record_id)
+            self._write({'id': record_id, 'done': True})
+            if not segment and record['segment'] == next(iter(self._segments)):
+                self._compact()
+            self._rotate_if_needed()
+            self._sync_if_needed()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def wrap_post(self, post):
+        """
+        Returns function posting result and marking it done unless posting
+        failed with retriable error.
+        """
+        def spooled_post(msg, payload):
+            try:
+                post(msg, payload)
+            except Exception as e:
+                if not is_retriable(e):
+                    self.done(payload)
+                elif isinstance(e, exceptions.CircuitOpenError):
+                    # The result is kept in the spool, see handle_error().
+                    e.payload = payload
+                raise
+            self.done(payload)
+
+        return spooled_post
+
+    def wrap_submit(self, submit):
+        """
+        Returns function appending result to spool before submitting it.
+        """
+        def spooled_submit(msg, payload):
+            submit(msg, self.append(msg.msg_id, payload))
+
+        return spooled_submit
+
+    def _payload(self, record):
+        payload = SpooledPayload(record['payload'])
+        payload.spool_id = record['id']
+        return payload
+
+    def _add(self, record):
+        # Written first so the record is not pending if writing fails.
+        self._write({
+            'id': record['id'], 'msg_id': record['msg_id'], 'payload': record['payload']})
+        record['segment'] = self._segment
+        self._records[record['id']] = record
+        self._segments[self._segment].add(record['id'])
+
+    def _write(self, data):
+        self._file.write(codec.dumps(data) + '\n')
+        self._file.flush()
+
+    def _rotate_if_needed(self):
+        if self._file.tell() < self.segment_size:
+            return
+
+        self._sync()
+        self._file.close()
+        self._start_segment()
+        self._compact()
+
+    def _sync_if_needed(self):
+        elapsed = self.timer() - self._last_sync
+        if elapsed >= self.fsync_interval:
+            self._sync()
+        elif self._sync_timer is None:
+            self._sync_timer = threading.Timer(
+                self.fsync_interval - elapsed, self._sync_on_timer)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _sync_on_timer(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def _sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = self.timer()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _start_segment(self):
+        self._segment = max(self._segments, default=0) + 1
+        self._segments[self._segment] = set()
+        self._file = open(self._path(self._segment), 'a', encoding='utf-8')
+
+    def _compact(self):
+        # Segments are removed oldest first only, because they can contain
+        # "done" records for results in older segments.
+        while len(self._segments) > 1:
+            segment, record_ids = next(iter(self._segments.items()))
+            if record_ids:
+                if len(self._segments) <= self.max_segments:
+                    return
+
+                for record_id in sorted(record_ids):
+                    self._add(self._records[record_id])
+                self._sync()
+
+            del self._segments[segment]
+            os.remove(self._path(segment))
+
+    def _load(self):
+        segments = sorted(
+            number for number in map(_segment_number, os.listdir(self.directory))
+            if number is not None)
+
+        for segment in segments:
+            self._segments[segment] = set()
+            with open(self._path(segment), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        data = codec.loads(line)
+                    except ValueError:
+                        # Incomplete record written before crash
+                        continue
+
+                    record_id = data['id']
+                    self._next_id = max(self._next_id, record_id + 1)
+
+                    # Record can be also copied to newer segment by compaction
+                    record = self._records.pop(record_id, None)
+                    if record is not None:
+                        self._segments[record['segment']].discard(record_id)
+
+                    if not data.get('done'):
+                        data['segment'] = segment
+                        self._records[record_id] = data
+                        self._segments[segment].add(record_id)
+
+        while self._segments:
+            segment, record_ids = next(iter(self._segments.items()))
+            if record_ids:
+                break
+            del self._segments[segment]
+            os.remove(self._path(segment))
@@ -0,0 +1,115 @@
+"""
+Timing of message processing stages.
+
+Durations of stages are reported to hooks added with add_hook(). Each hook
+is called with stage name, duration in seconds excluding nested stages and
+the message (None for STAGE_CREATE_MESSAGE). Without hooks, stage() returns
+a shared no-op context manager.
+"""
+import contextlib
+import contextvars
+import importlib
+import threading
+import time
+
+from . import config, metrics
+
+# Parsing received message.
+STAGE_CREATE_MESSAGE = 'create_message'
+# Selecting handler for the message.
+STAGE_CLASSIFY = 'classify'
+# Handler extracting result data from the message.
+STAGE_EXTRACT = 'extract'
+# Serializing and cropping result payload.
+STAGE_SERIALIZE = 'serialize'
+# Request to ResultsDB.
+STAGE_HTTP = 'http'
+# Waiting for results of the message posted from other threads.
+STAGE_WAIT = 'wait'
+
+_NOOP = contextlib.nullcontext()
+
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+# Innermost stage in progress. Context variable instead of thread-local
+# keeps stages of concurrent asyncio tasks apart.
+_current = contextvars.ContextVar('resultsdbupdater_timing_stage', default=None)
+
+
+def add_hook(hook):
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook):
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def load_hook(path):
+    """
+    Returns hook from "package.module:function" path.
+    """
+    module_name, _, name = path.partition(':')
+    if not name:
+        raise ValueError('Expected "module:function", got "{0}"'.format(path))
+    return getattr(importlib.import_module(module_name), name)
+
+
+def observe_metrics(stage, duration, msg):
+    """
+    Hook recording stage durations in metrics.STAGE_DURATION.
+    """
+    metrics.STAGE_DURATION.observe(duration, stage)
+
+
+class _Stage(object):
+    __slots__ = ('name', 'msg', 'hooks', 'thread', 'parent', 'token', 'nested', 'start')
+
+    def __init__(self, name, msg, hooks):
+        self.name = name
+        self.msg = msg
+        self.hooks = hooks
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.token = _current.set(self)
+        self.nested = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self.token)
+
+        # Asyncio tasks inherit context from the thread creating them.
+        parent = self.parent
+        if parent is not None and parent.thread == self.thread:
+            parent.nested += elapsed
+
+        duration = elapsed - self.nested
+        for hook in self.hooks:
+            try:
+                hook(self.name, duration, self.msg)
+            except Exception:
+                config.LOGGER.exception('Timing hook %r failed', hook)
+
+        return False
+
+
+def stage(name, msg=None):
+    """
+    Returns context manager timing a processing stage.
+
+    Args:
+        name (string) - Stage name, one of STAGE_* constants
+        msg (Message) - Processed message
+    """
+    hooks = _hooks
+    if not hooks:
+        return _NOOP
+    return _Stage(name, msg, hooks)
@@ -0,0 +1,147 @@
+"""
+End-to-end latency of messages from publishing to results accepted by
+ResultsDB.
+
+Spans are exported as JSON lines with trace ID set to the message ID:
+"queue" (from publishing to receiving the message), "consume" (handling
+the message) and "create_result" (each request accepted by ResultsDB).
+"""
+import contextlib
+import random
+import threading
+import time
+
+from . import codec, metrics
+
+
+class Trace(object):
+    """
+    Trace of a consumed message.
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'published', 'received')
+
+    def __init__(self, trace_id, published, received):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.published = published
+        self.received = received
+
+
+class SpanFileExporter(object):
+    """
+    Appends spans to a file as JSON lines.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (string) - Path to the file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def export(self, trace, name, start, end, span_id=None, parent_span_id=None, **attributes):
+        line = codec.dumps({
+            'trace_id': trace.trace_id,
+            'span_id': span_id or new_span_id(),
+            'parent_span_id': parent_span_id,
+            'name': name,
+            'start_time': start,
+            'end_time': end,
+            'attributes': attributes,
+        })
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# Exports spans if set; CIConsumer sets this to SpanFileExporter if
+# trace_file option is set.
+span_exporter = None
+
+
+def new_span_id():
+    return '%016x' % random.getrandbits(64)
+
+
+def publish_time(msg):
+    """
+    Returns time the message was published in seconds since epoch or None if
+    it's unknown.
+
+    Uses "timestamp" header (milliseconds, set by broker) or "timestamp" in
+    fedmsg envelope (seconds).
+    """
+    if not isinstance(msg.msg_data, dict):
+        return None
+
+    for timestamp, scale in (
+            (msg.header('timestamp'), 1000),
+            (msg.msg_data.get('timestamp'), 1)):
+        try:
+            published = float(timestamp) / scale
+        except (TypeError, ValueError):
+            continue
+        if published > 0:
+            return published
+
+    return None
+
+
+@contextlib.contextmanager
+def trace(msg):
+    """
+    Traces handling of the message in the with-statement body.
+
+    Records consumer lag in metrics.CONSUMER_LAG and sets msg.trace so
+    result_accepted() can compute latency of the results.
+    """
+    received = time.time()
+    published = publish_time(msg)
+    msg.trace = Trace(msg.msg_id, published, received)
+    if published is not None:
+        metrics.CONSUMER_LAG.observe(max(0.0, received - published))
+
+    error = None
+    try:
+        yield msg.trace
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        exporter = span_exporter
+        if exporter is not None:
+            if published is not None:
+                exporter.export(msg.trace, 'queue', published, received, topic=msg.topic)
+            exporter.export(
+                msg.trace, 'consume', received, time.time(),
+                span_id=msg.trace.span_id, topic=msg.topic, error=error)
+
+
+def result_accepted(msg, started):
+    """
+    Records latency of a result accepted by ResultsDB.
+
+    Args:
+        msg (Message) - Message the result was created for
+        started (float) - Time the request was sent
+    """
+    msg_trace = msg.trace
+    if msg_trace is None:
+        # Result replayed from spool or dead-letter store.
+        return
+
+    now = time.time()
+    latency = now - msg_trace.received
+    metrics.RESULT_LATENCY.observe(latency)
+
+    exporter = span_exporter
+    if exporter is not None:
+        exporter.export(
+            msg_trace, 'create_result', started, now,
+            parent_span_id=msg_trace.span_id, latency=latency)
@@ -1,65 +1,161 @@
-from fnmatch import fnmatch
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+import functools
 import json
+import threading
+import time
 import uuid
 import re
 
+from .artifacts import ARTIFACT_TYPES
+from .breaker import CircuitBreaker
+from .cache import SingleFlight, TTLCache
+from .deadletter import handle_error
+from .group_index import GroupIndex
 from .session import session
 
-from . import config, exceptions
+from . import codec, config, exceptions, metrics, timing, tracing
 
 
 # Maximum length of a text value for result data.
 MAX_RESULT_DATA_SIZE = 8192
 
+# Maximum number of cached test case names checked for private test cases.
+PRIVATE_TESTCASE_CACHE_SIZE = 4096
+
+# Groups by description, avoids querying ResultsDB for each result in a group.
+GROUP_CACHE = TTLCache(config.GROUP_CACHE_SIZE, config.GROUP_CACHE_TTL)
+# Group lookups in progress by description.
+GROUP_LOOKUPS = SingleFlight()
+# Group UUIDs by description persisted across restarts.
+GROUP_INDEX = None
+if config.GROUP_INDEX_PATH:
+    GROUP_INDEX = GroupIndex(
+        config.GROUP_INDEX_PATH, config.GROUP_INDEX_SIZE, config.GROUP_INDEX_MAX_AGE)
+# Fails fast on requests to ResultsDB while it's unavailable.
+CIRCUIT_BREAKER = None
+if config.CIRCUIT_BREAKER_THRESHOLD > 0:
+    CIRCUIT_BREAKER = CircuitBreaker(
+        config.CIRCUIT_BREAKER_THRESHOLD, config.CIRCUIT_BREAKER_RESET_TIMEOUT)
+
+
+def circuit_breaker(fn):
+    """
+    Decorator for functions sending requests to ResultsDB.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if CIRCUIT_BREAKER is None:
+            return fn(*args, **kwargs)
+        return CIRCUIT_BREAKER.call(fn, *args, **kwargs)
+
+    return wrapper
+
 
-def json_serialize_data_item(item):
-    if isinstance(item, list):
-        return [
-            json.dumps(v) if isinstance(v, dict) else v
-            for v in item
-        ]
+def _text_size(text):
+    """
+    Returns size of text encoded in UTF-8, or a lower bound of the size
+    larger than MAX_RESULT_DATA_SIZE if the text is too large.
+    """
+    # Each character takes at least one byte, and exactly one if the text is
+    # ASCII, so only short non-ASCII text needs to be encoded.
+    if text.isascii() or len(text) > MAX_RESULT_DATA_SIZE:
+        return len(text)
+    return len(text.encode('utf-8', 'surrogatepass'))
 
-    if isinstance(item, dict):
-        return json.dumps(item)
 
-    return item
+def _item_size(item):
+    if isinstance(item, str):
+        return _text_size(item)
+    if isinstance(item, (bool, int, float)) or item is None:
+        # Too small to be cropped (except for huge integers whose
+        # conversion to text is limited anyway).
+        return 0
+    return _text_size(str(item))
 
 
-def json_serialize_data(data):
+def _crop_text(log, key, text):
+    """
+    Returns text cropped to MAX_RESULT_DATA_SIZE bytes in UTF-8, ending with
+    "...".
+    """
+    log.warning('Cropping large value for field %s', key)
+    limit = MAX_RESULT_DATA_SIZE - 3
+    # Lone surrogates (invalid in UTF-8) are kept and counted as three bytes.
+    encoded = text[:limit].encode('utf-8', 'surrogatepass')[:limit]
+    try:
+        cropped = encoded.decode('utf-8', 'surrogatepass')
+    except UnicodeDecodeError as e:
+        # Drops partial multi-byte character at the end.
+        cropped = encoded[:e.start].decode('utf-8', 'surrogatepass')
+    cropped += '...'
+    # _text_size() returns only a lower bound for long text.
+    metrics.CROPPED_BYTES.inc(
+        amount=len(text.encode('utf-8', 'surrogatepass'))
+        - len(cropped.encode('utf-8', 'surrogatepass')))
+    return cropped
+
+
+def _crop_value(log, key, value):
     """
-    Serialize data correctly for ResultsDB.
+    Returns value or list with items cropped to MAX_RESULT_DATA_SIZE bytes.
 
-    Results data should be only strings or lists of strings, otherwise the data
-    are stored as string representations of Python objects in ResultsDB.
+    Raises InvalidMessageError if non-string value is too large.
     """
-    return {
-        k: json_serialize_data_item(v)
-        for k, v in data.items()
-    }
+    if isinstance(value, str):
+        if _text_size(value) > MAX_RESULT_DATA_SIZE:
+            return _crop_text(log, key, value)
+        return value
+
+    if isinstance(value, list):
+        cropped = value
+        for i, item in enumerate(value):
+            if _item_size(item) > MAX_RESULT_DATA_SIZE:
+                if cropped is value:
+                    cropped = list(value)
+                cropped[i] = _crop_text(log, key, str(item))
+        return cropped
+
+    if _item_size(value) > MAX_RESULT_DATA_SIZE:
+        raise exceptions.InvalidMessageError(
+            'Result value "{0}" is too large'.format(key))
 
+    return value
 
-def crop_data(log, data):
+
+def serialize_data(log, data):
     """
-    Crops large data values so they can be stored in ResultsDB.
+    Returns result data serialized and cropped for ResultsDB.
+
+    Results data should be only strings or lists of strings, otherwise the
+    data are stored as string representations of Python objects in
+    ResultsDB. Dict values and dicts in lists are encoded as JSON strings
+    (with the json module rather than codec so the values stored in
+    ResultsDB keep their format); these strings are encoded again as part
+    of the payload.
 
     Even thought size for result data are not limited in database schema,
     Postgresql index has a size limited ("Values larger than 1/3 of a buffer
-    page cannot be indexed").
+    page cannot be indexed"). Each item in a list is stored as separate
+    value, so the items are cropped individually. Values are serialized and
+    cropped in the same walk over the data.
+
+    The size is measured in bytes of the value encoded in UTF-8. The number
+    of cropped bytes is counted in metrics.CROPPED_BYTES.
 
     Raises InvalidMessageError if non-string value is too large.
     """
+    serialized = {}
     for k, v in data.items():
-        if isinstance(v, str):
-            if len(v) > MAX_RESULT_DATA_SIZE:
-                log.warning('Cropping large value for field %s', k)
-                data[k] = v[:MAX_RESULT_DATA_SIZE - 3] + "..."
+        if isinstance(v, dict):
+            v = json.dumps(v)
         elif isinstance(v, list):
-            if any(len(str(item)) > MAX_RESULT_DATA_SIZE for item in v):
-                raise exceptions.InvalidMessageError(
-                    'Result value "{0}" contains items that are too large'.format(k))
-        elif len(str(v)) > MAX_RESULT_DATA_SIZE:
-            raise exceptions.InvalidMessageError(
-                'Result value "{0}" is too large'.format(k))
+            v = [json.dumps(item) if isinstance(item, dict) else item for item in v]
+
+        serialized[k] = _crop_value(log, k, v)
+
+    return serialized
 
 
 def update_publisher_id(data, msg):
@@ -72,35 +168,49 @@ def update_publisher_id(data, msg):
         data['publisher_id'] = msg_publisher_id
 
 
-def create_result(msg, testcase, outcome, ref_url, data, groups=None, note=None):
+def prepare_result(msg, testcase, outcome, ref_url, data, groups=None, note=None):
+    """
+    Returns serialized payload for a new result.
+
+    Raises InvalidMessageError if the result cannot be stored in ResultsDB.
+    """
     msg_publisher_id = msg.header('JMSXUserID')
     testcase_name = testcase['name'] if isinstance(testcase, dict) else testcase
     verify_private_testcase(msg_publisher_id, testcase_name)
 
-    log = msg.log
-    data = json_serialize_data(data)
-    crop_data(log, data)
-
-    payload = json.dumps({
-        'testcase': testcase,
-        'groups': groups or [],
-        'outcome': outcome,
-        'ref_url': ref_url,
-        'note': note or '',
-        'data': data
-    })
+    with timing.stage(timing.STAGE_SERIALIZE, msg):
+        return codec.dumps({
+            'testcase': testcase,
+            'groups': groups or [],
+            'outcome': outcome,
+            'ref_url': ref_url,
+            'note': note or '',
+            'data': serialize_data(msg.log, data),
+        })
+
+
+@circuit_breaker
+def post_result(msg, payload):
+    """
+    Posts serialized result payload to ResultsDB.
 
+    Raises CreateResultError if ResultsDB rejects the result.
+    """
+    log = msg.log
     log.debug('Requesting new result: %s', payload)
 
-    post_req = session.post(
-        '{0}/results'.format(config.RESULTSDB_API_URL),
-        data=payload,
-        headers={
-            'content-type': 'application/json',
-        },
-        auth=config.RESULTSDB_AUTH,
-        timeout=config.TIMEOUT,
-        verify=config.TRUSTED_CA)
+    started = time.time()
+    with timing.stage(timing.STAGE_HTTP, msg), \
+            metrics.REQUEST_DURATION.time('create_result'):
+        post_req = session.post(
+            '{0}/results'.format(config.RESULTSDB_API_URL),
+            data=codec.encode(payload),
+            headers={
+                'content-type': 'application/json',
+            },
+            auth=config.RESULTSDB_AUTH,
+            timeout=config.TIMEOUT,
+            verify=config.TRUSTED_CA)
 
     log.debug('New result requested (HTTP %s)', post_req.status_code)
 
@@ -109,14 +219,142 @@ def create_result(msg, testcase, outcome, ref_url, data, groups=None, note=None)
         raise exceptions.CreateResultError(message, payload)
 
     post_req.raise_for_status()
+    tracing.result_accepted(msg, started)
 
 
-def get_first_group(description):
-    get_req = session.get(
-        '{0}/groups?description={1}'.format(config.RESULTSDB_API_URL, description),
-        timeout=config.TIMEOUT,
-        verify=config.TRUSTED_CA,
-    )
+# Called with (msg, payload) for each prepared result. Results are posted
+# directly by default; CIConsumer replaces this with ResultPipeline.put if
+# results should be posted from worker threads, or with
+# AsyncResultsDBClient.submit_result if asyncio client is used.
+submit_result = post_result
+
+
+# Result types and outcomes counted separately in metrics.RESULTS besides
+# registered artifact types.
+METRIC_RESULT_TYPES = frozenset([
+    'brew-build_scratch', 'koji_build', 'koji_build_scratch', 'unknown', 'unknown_scratch'])
+METRIC_OUTCOMES = frozenset([
+    'PASSED', 'INFO', 'FAILED', 'NEEDS_INSPECTION', 'ERROR', 'QUEUED', 'RUNNING'])
+
+
+def result_metric_labels(data, outcome):
+    """
+    Returns label values (type, outcome) for metrics.RESULTS.
+
+    Unknown types and outcomes are counted as "other" so messages cannot
+    create any number of label values.
+    """
+    result_type = data.get('type', 'unknown')
+    if not isinstance(result_type, str) or (
+            result_type not in ARTIFACT_TYPES and result_type not in METRIC_RESULT_TYPES):
+        result_type = 'other'
+    if not isinstance(outcome, str) or outcome not in METRIC_OUTCOMES:
+        outcome = 'other'
+    return result_type, outcome
+
+
+def create_result(msg, testcase, outcome, ref_url, data, groups=None, note=None,
+                  batch=None):
+    payload = prepare_result(msg, testcase, outcome, ref_url, data, groups, note)
+    metrics.RESULTS.inc(*result_metric_labels(data, outcome))
+    if batch is None:
+        submit_result(msg, payload)
+    else:
+        batch.add(payload)
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=config.BATCH_MAX_IN_FLIGHT,
+                thread_name_prefix='ResultBatch')
+        return _batch_executor
+
+
+class ResultBatch(object):
+    """
+    Collects results created for a single message and submits them together.
+
+    Results are submitted in parallel, at most BATCH_MAX_IN_FLIGHT at a time.
+    No result is submitted if preparing any of them fails.
+    """
+
+    def __init__(self, msg):
+        """
+        Args:
+            msg (Message) - Message the results were created for
+        """
+        self.msg = msg
+        self.payloads = []
+
+    def add(self, payload):
+        self.payloads.append(payload)
+
+    def submit(self):
+        """
+        Submits all collected results.
+
+        If posting some of the results fails, still submits the remaining
+        ones and raises the first error. Other errors are handled here, so
+        each rejected result is logged and stored in dead-letter directory.
+        """
+        payloads, self.payloads = self.payloads, []
+
+        if config.BATCH_MAX_IN_FLIGHT <= 1 or len(payloads) <= 1:
+            errors = [self._submit(payload) for payload in payloads]
+        else:
+            executor = _get_batch_executor()
+            futures = [
+                executor.submit(submit_result, self.msg, payload)
+                for payload in payloads
+            ]
+
+            with timing.stage(timing.STAGE_WAIT, self.msg):
+                errors = [future.exception() for future in futures]
+
+        failed = [
+            (error, payload) for error, payload in zip(errors, payloads) if error is not None]
+        if failed:
+            for error, payload in failed[1:]:
+                handle_error(self.msg, error, payload)
+            raise failed[0][0]
+
+    def _submit(self, payload):
+        """
+        Submits a result and returns the error or None.
+        """
+        try:
+            submit_result(self.msg, payload)
+        except Exception as e:
+            return e
+        return None
+
+
+def _remember_group(description, group):
+    GROUP_CACHE.set(description, group)
+    if GROUP_INDEX is not None:
+        GROUP_INDEX.set(description, group['uuid'])
+
+
+@circuit_breaker
+def fetch_first_group(description):
+    """
+    Returns the first group with given description from ResultsDB or an empty
+    dict if there is no such group.
+    """
+    with timing.stage(timing.STAGE_HTTP), \
+            metrics.REQUEST_DURATION.time('get_first_group'):
+        get_req = session.get(
+            '{0}/groups?description={1}'.format(config.RESULTSDB_API_URL, description),
+            timeout=config.TIMEOUT,
+            verify=config.TRUSTED_CA,
+        )
     get_req.raise_for_status()
     if len(get_req.json()['data']) > 0:
         return get_req.json()['data'][0]
@@ -124,6 +362,49 @@ def get_first_group(description):
     return {}
 
 
+# Called with group description to query the first group from ResultsDB;
+# replaced with AsyncResultsDBClient.query_first_group if asyncio client is
+# used.
+query_first_group = fetch_first_group
+
+
+def get_first_group(description):
+    group = GROUP_CACHE.get(description)
+    if group is not None:
+        return group
+
+    if GROUP_INDEX is not None:
+        group_uuid = GROUP_INDEX.get(description)
+        if group_uuid is not None:
+            group = {'uuid': group_uuid, 'description': description}
+            GROUP_CACHE.set(description, group)
+            return group
+
+    group = query_first_group(description)
+    if group:
+        _remember_group(description, group)
+    return group
+
+
+def get_or_create_group_uuid(description):
+    """
+    Returns UUID of the first group with given description or a new UUID.
+
+    Concurrent calls for the same description share a single lookup and the
+    generated UUID.
+    """
+    def lookup():
+        group = get_first_group(description)
+        if not group:
+            # Remember the group before it's created so the following results
+            # are added to the same group without querying ResultsDB.
+            group = {'uuid': str(uuid.uuid4()), 'description': description}
+            _remember_group(description, group)
+        return group['uuid']
+
+    return GROUP_LOOKUPS.do(description, lookup)
+
+
 def handle_ci_metrics(msg):
     team = msg.get('team', default='unassigned')
     if team == 'unassigned':
@@ -162,6 +443,7 @@ def handle_ci_metrics(msg):
         'ref_url': group_ref_url
     }]
     overall_outcome = 'PASSED'
+    batch = ResultBatch(msg)
 
     for test in tests:
         if 'failed' in test and int(test['failed']) == 0:
@@ -184,7 +466,8 @@ def handle_ci_metrics(msg):
         test['brew_task_id'] = brew_task_id
 
         update_publisher_id(data=test, msg=msg)
-        create_result(msg, testcase, outcome, group_tests_ref_url, test, groups)
+        create_result(
+            msg, testcase, outcome, group_tests_ref_url, test, groups, batch=batch)
 
     # Create the overall test result
     testcase = {
@@ -202,7 +485,54 @@ def handle_ci_metrics(msg):
     }
 
     update_publisher_id(data=result_data, msg=msg)
-    create_result(msg, testcase, overall_outcome, group_tests_ref_url, result_data, groups)
+    create_result(
+        msg, testcase, overall_outcome, group_tests_ref_url, result_data, groups,
+        batch=batch)
+    batch.submit()
+
+
+# Prefix of topics in the current format.
+CI_TOPIC_PREFIX = '/topic/VirtualTopic.eng.ci.'
+
+# Test outcomes overridden by the last topic component.
+TOPIC_STATE_OUTCOMES = {
+    'error': 'ERROR',
+    'queued': 'QUEUED',
+    'running': 'RUNNING',
+}
+
+TopicInfo = namedtuple('TopicInfo', ('namespace', 'artifact', 'event', 'state', 'outcome'))
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_topic(topic):
+    """
+    Returns TopicInfo with components of a message topic.
+
+    The expected topic format is:
+
+        /topic/VirtualTopic.eng.ci.<namespace>.<artifact>.<event>.{queued,running,complete,error}
+
+    The namespace, artifact and event are None if the topic does not have
+    the expected format. The state is the last component of any topic with
+    a dot, outcome is the test outcome implied by the state (or None).
+    """
+    _, dot, state = topic.rpartition('.')
+    if not dot:
+        state = None
+
+    namespace = artifact = event = None
+    if topic.startswith(CI_TOPIC_PREFIX):
+        topic_components = topic.split('.')
+        if len(topic_components) == 7:
+            namespace, artifact, event = topic_components[3:6]
+
+    return TopicInfo(
+        namespace=namespace,
+        artifact=artifact,
+        event=event,
+        state=state,
+        outcome=TOPIC_STATE_OUTCOMES.get(state))
 
 
 def _test_result_outcome(topic, outcome):
@@ -214,12 +544,9 @@ def _test_result_outcome(topic, outcome):
 
     Test outcome is ERROR for messages with "*.error" topic.
     """
-    if topic.endswith('.error'):
-        return 'ERROR'
-    elif topic.endswith('.queued'):
-        return 'QUEUED'
-    elif topic.endswith('.running'):
-        return 'RUNNING'
+    topic_outcome = parse_topic(topic).outcome
+    if topic_outcome is not None:
+        return topic_outcome
 
     broken_mapping = {
         'pass': 'PASSED',
@@ -244,14 +571,7 @@ def namespace_from_topic(topic):
 
         /topic/VirtualTopic.eng.ci.<namespace>.<artifact>.<event>.{queued,running,complete,error}
     """
-    if not topic.startswith('/topic/VirtualTopic.eng.ci.'):
-        return None
-
-    topic_components = topic.split('.')
-    if len(topic_components) != 7:
-        return None
-
-    return topic_components[3]
+    return parse_topic(topic).namespace
 
 
 def namespace_from_testcase_name(testcase_name):
@@ -297,7 +617,7 @@ def verify_topic_and_testcase_name(topic, testcase_name):
 
         /topic/VirtualTopic.eng.ci.baseos-ci.redhat-module.test.complete
     """
-    topic_namespace = namespace_from_topic(topic)
+    topic_namespace = parse_topic(topic).namespace
     if not topic_namespace:
         raise exceptions.MissingTopicError(
             topic=topic,
@@ -312,9 +632,51 @@ def verify_topic_and_testcase_name(topic, testcase_name):
             topic_namespace=topic_namespace)
 
 
+class PrivateTestCaseMatcher(object):
+    """
+    Finds publishers required for private test cases.
+
+    All glob patterns are compiled into a single regular expression so
+    public test cases are rejected with a single match. Matches are cached
+    by test case name.
+    """
+
+    def __init__(self, publisher_map, cache_size=PRIVATE_TESTCASE_CACHE_SIZE):
+        """
+        Args:
+            publisher_map (list) - Pairs of test case glob pattern and
+                publisher ID
+            cache_size (int) - Maximum number of cached test case names
+        """
+        self.patterns = tuple(
+            (re.compile(translate(testcase_glob)), testcase_glob, publisher_id)
+            for testcase_glob, publisher_id in publisher_map)
+        self.any_pattern = None
+        if self.patterns:
+            self.any_pattern = re.compile('|'.join(
+                '(?:{0})'.format(pattern.pattern) for pattern, _, _ in self.patterns))
+        self.matching = functools.lru_cache(maxsize=cache_size)(self._matching)
+
+    def _matching(self, testcase_name):
+        """
+        Returns tuple of (glob pattern, publisher ID) matching test case name.
+        """
+        if self.any_pattern is None or not self.any_pattern.match(testcase_name):
+            return ()
+
+        return tuple(
+            (testcase_glob, publisher_id)
+            for pattern, testcase_glob, publisher_id in self.patterns
+            if pattern.match(testcase_name)
+        )
+
+
+PRIVATE_TESTCASES = PrivateTestCaseMatcher(config.PRIVATE_TESTCASE_PUBLISHER_MAP)
+
+
 def verify_private_testcase(msg_publisher_id, testcase_name):
-    for testcase_glob, publisher_id in config.PRIVATE_TESTCASE_PUBLISHER_MAP:
-        if fnmatch(testcase_name, testcase_glob) and publisher_id != msg_publisher_id:
+    for testcase_glob, publisher_id in PRIVATE_TESTCASES.matching(testcase_name):
+        if publisher_id != msg_publisher_id:
             raise exceptions.PrivateTestCaseMismatchError(
                 publisher_id=publisher_id,
                 msg_publisher_id=msg_publisher_id,
@@ -350,235 +712,12 @@ def handle_ci_umb(msg):
         'url': test_run_url
     }]
 
-    if item_type == 'productmd-compose':
-        architecture = msg.system('architecture')
-        variant = msg.system('variant', default=None)
-        # Field compose_id in artifacts is deprecated.
-        compose_id = msg.get('artifact', 'id', default=None) or msg.get('artifact', 'compose_id')
-        item = '{0}/{1}/{2}'.format(compose_id, variant or 'unknown', architecture)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-
-                ('type', item_type),
-                ('productmd.compose.id', compose_id),
-
-                ('system_provider', msg.system('provider')),
-                ('system_architecture', architecture),
-                ('system_variant', variant),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'product-build':
-        product = msg.get('artifact', 'name')
-        version = msg.get('artifact', 'version')
-        release = msg.get('artifact', 'release')
-        item = '{0}-{1}-{2}'.format(product, version, release)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-                ('product', product),
-                ('version', version),
-                ('release', release),
-                ('log', msg.get('run', 'log')),
-                ('type', item_type),
-                ('system_architecture', msg.system('architecture')),
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'component-version':
-        component = msg.get('artifact', 'component')
-        version = msg.get('artifact', 'version')
-        item = '{0}-{1}'.format(component, version)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-
-                ('type', item_type),
-                ('component', component),
-                ('version', version),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'container-image':
-        repo = msg.get('artifact', 'repository')
-        digest = msg.get('artifact', 'digest')
-        item = '{0}@{1}'.format(repo, digest)
-        result_data = {
-            key: value for key, value in (
-                ('item', item),
-
-                ('log', msg.get('run', 'log')),
-                ('rebuild', msg.get('run', 'rebuild', default=None)),
-                ('xunit', msg.result.xunit),
-
-                ('type', item_type),
-                ('repository', msg.get('artifact', 'repository', default=None)),
-                ('digest', msg.get('artifact', 'digest', default=None)),
-                ('format', msg.get('artifact', 'format', default=None)),
-                ('pull_ref', msg.get('artifact', 'pull_ref', default=None)),
-                ('scratch', msg.get('artifact', 'scratch', default=None)),
-                ('nvr', msg.get('artifact', 'nvr', default=None)),
-                ('issuer', msg.get('artifact', 'issuer', default=None)),
-
-                ('system_os', msg.system('os', default=None)),
-                ('system_provider', msg.system('provider', default=None)),
-                ('system_architecture', msg.system('architecture', default=None)),
-
-                ('category', msg.result.category),
-            ) if value is not None
-        }
-
-    elif item_type == 'redhat-container-image':
-        result_data = {
-            'item': msg.get('artifact', 'id'),
-            'type': item_type,
-            'brew_task_id': msg.get('artifact', 'task_id', default=None),
-            'brew_build_id': msg.get('artifact', 'build_id', default=None),
-            'category': msg.result.category,
-            'full_names': msg.get('artifact', 'full_names'),
-            'registry_url': msg.get('artifact', 'registry_url', default=None),
-            'tag': msg.get('artifact', 'tag', default=None),
-            'issuer': msg.get('artifact', 'issuer'),
-            'component': msg.get('artifact', 'component'),
-            'name': msg.get('artifact', 'name', default=None),
-            'namespace': msg.get('artifact', 'namespace'),
-            'scratch': msg.get('artifact', 'scratch'),
-            'nvr': msg.get('artifact', 'nvr'),
-            'source': msg.get('artifact', 'source'),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-        }
-
-    elif item_type == 'redhat-module':
-        # The pagure.io/messages spec defines the NSVC delimited with ':' and the stream name can
-        # contain '-', which MBS changes to '_' when importing to koji.
-        # See https://github.com/release-engineering/resultsdb-updater/pull/73
-        nsvc_regex = re.compile('^(.*):(.*):(.*):(.*)')
-        nsvc = msg.get('artifact', 'nsvc')
-        try:
-            name, stream, version, context = re.match(nsvc_regex, nsvc).groups()
-            stream = stream.replace('-', '_')
-        except AttributeError:
-            raise exceptions.InvalidMessageError('Invalid nsvc "%s" encountered' % nsvc)
-
-        nsvc = '{}-{}-{}.{}'.format(name, stream, version, context)
-
-        result_data = {
-            'item': nsvc,
-            'type': item_type,
-            'mbs_id': msg.get('artifact', 'id', default=None),
-            'category': msg.result.category,
-            'context': msg.get('artifact', 'context'),
-            'name': msg.get('artifact', 'name'),
-            'nsvc': nsvc,
-            'stream': msg.get('artifact', 'stream'),
-            'version': msg.get('artifact', 'version'),
-            'issuer': msg.get('artifact', 'issuer', default=None),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'redhat-advisory':
-        item = msg.get('artifact', 'id')
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'category': msg.result.category,
-            'numeric_id': msg.get('artifact', 'numeric_id', default=None),
-
-            'pipeline_id': msg.get('pipeline', 'id'),
-            'pipeline_name': msg.get('pipeline', 'name'),
-            'pipeline_build': msg.get('pipeline', 'build', default=None),
-            'pipeline_stage': msg.get('pipeline', 'stage', 'name', default=None),
-
-            'log': msg.get('run', 'log'),
-            'log_raw': msg.get('run', 'log_raw', default=None),
-            'log_stream': msg.get('run', 'log_stream', default=None),
-
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'brew-build':
-        item = msg.get('artifact', 'nvr')
-        component = msg.get('artifact', 'component')
-        scratch = msg.get('artifact', 'scratch', default='')
-        brew_task_id = msg.get('artifact', 'id', default=None)
-
-        # scratch is supposed to be a bool but some messages in the wild
-        # use a string instead
-        if not isinstance(scratch, bool):
-            try:
-                scratch = scratch.lower() == 'true'
-            except AttributeError:
-                scratch = False
-
-        # we need to differentiate between scratch and non-scratch builds
-        if scratch:
-            item_type += '_scratch'
-
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'brew_task_id': brew_task_id,
-            'category': msg.result.category,
-            'component': component,
-            'scratch': scratch,
-            'issuer': msg.get('artifact', 'issuer', default=None),
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'brew-build-group':
-        item = msg.get('artifact', 'id')
-        repository = msg.get('artifact', 'repository')
-        builds = msg.get('artifact', 'builds')
-
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'category': msg.result.category,
-            'repository': repository,
-            'builds': builds,
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-        }
-
-    elif item_type == 'product-scenario':
-        product_scenario = msg.get('artifact', 'id')
-        products = msg.get('artifact', 'products')
-        products_data = [json.dumps(product) for product in products]
-        item = [product.get('nvr', product['id']) for product in products]
-        item.insert(0, product_scenario)
-        result_data = {
-            'item': item,
-            'type': item_type,
-            'rebuild': msg.get('run', 'rebuild', default=None),
-            'log': msg.get('run', 'log'),
-            'system_os': msg.system('os', default=None),
-            'system_provider': msg.system('provider', default=None),
-            'products': products_data,
-        }
-
-    else:
+    extract = ARTIFACT_TYPES.get(item_type)
+    if extract is None:
         raise exceptions.InvalidMessageError('Unknown artifact type "%s"' % item_type)
 
+    result_data = extract(msg)
+
     result_data.update(msg.contact_dict)
     result_data['recipients'] = msg.recipients
 
@@ -635,6 +774,7 @@ def handle_resultsdb_format(msg):
             'uuid': str(uuid.uuid4()),
             'ref_url': group_ref_url
         }]
+        batch = ResultBatch(msg)
 
         for testcase, result in results.items():
             result_data = result.get('data', {})
@@ -647,14 +787,15 @@ def handle_resultsdb_format(msg):
                 result_data,
                 groups,
                 result.get('note', ''),
+                batch=batch,
             )
+        batch.submit()
 
     else:
         groups = [{
             # Check to see if there is a group already for these sets of tests,
             # otherwise, generate a UUID
-            'uuid': get_first_group(group_ref_url).get(
-                'uuid', str(uuid.uuid4())),
+            'uuid': get_or_create_group_uuid(group_ref_url),
             'ref_url': group_ref_url,
             # Set the description to the ref_url so that we can query for the
             # group by it later
@@ -13,9 +13,15 @@ setup(
     author_email='mprahl@redhat.com',
     url='https://github.com/release-engineering/resultsdb-updater',
     install_requires=requirements,
+    extras_require={
+        'asyncio': ['aiohttp'],
+        'orjson': ['orjson'],
+    },
     packages=find_packages(),
     entry_points="""
     [moksha.consumer]
     ciconsumer = resultsdbupdater.consumer:CIConsumer
+    [console_scripts]
+    resultsdb-updater-replay = resultsdbupdater.replay:main
     """,
 )
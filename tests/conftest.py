@@ -0,0 +1,18 @@
+import mock
+import pytest
+
+import resultsdbupdater.utils
+
+
+class FakeHub(object):
+    config = {}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def mock_session():
+    resultsdbupdater.utils.GROUP_CACHE.clear()
+    with mock.patch('resultsdbupdater.utils.session') as mocked:
+        yield mocked
@@ -0,0 +1,38 @@
+import json
+
+import mock
+
+from resultsdbupdater import artifacts
+from resultsdbupdater.message import create_message
+
+from .test_consumer import consumer, get_fake_msg
+
+
+def test_register_artifact_type():
+    fake_msg = get_fake_msg('redhat-container-image.test.complete')
+    fake_msg['body']['msg']['artifact']['type'] = 'custom-artifact'
+
+    with mock.patch.dict(artifacts.ARTIFACT_TYPES), \
+            mock.patch('resultsdbupdater.utils.session') as mock_session:
+        artifacts.register_artifact_type('custom-artifact', omit_none=True, fields=(
+            ('item', artifacts.artifact('id')),
+            ('missing', artifacts.artifact('missing', default=None)),
+            ('category', artifacts.category),
+        ))
+        consumer.consume(fake_msg)
+
+    assert 'custom-artifact' not in artifacts.ARTIFACT_TYPES
+    data = json.loads(mock_session.post.call_args[1]['data'])['data']
+    assert data['item'] == fake_msg['body']['msg']['artifact']['id']
+    assert data['type'] == 'custom-artifact'
+    assert data['category'] == 'functional'
+    assert 'missing' not in data
+
+
+def test_extractor_keeps_none_values():
+    fake_msg = get_fake_msg('redhat-container-image.test.complete')
+    del fake_msg['body']['msg']['artifact']['tag']
+    msg = create_message(fake_msg)
+
+    data = artifacts.ARTIFACT_TYPES['redhat-container-image'](msg)
+    assert data['tag'] is None
@@ -0,0 +1,112 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import mock
+import pytest
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import utils
+from resultsdbupdater.async_client import AsyncResultsDBClient
+
+from .conftest import FakeHub
+from .test_consumer import get_fake_msg
+
+pytest.importorskip('aiohttp')
+
+
+class StubResultsDBHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path, None))
+        self._reply(200, {'data': self.server.groups})
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        payload = json.loads(self.rfile.read(length))
+        self.server.requests.append(('POST', self.path, payload))
+        if payload.get('outcome') == 'INVALID':
+            self._reply(400, {'message': 'Invalid outcome'})
+        else:
+            self._reply(201, payload)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def resultsdb():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubResultsDBHandler)
+    server.requests = []
+    server.groups = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    url = 'http://127.0.0.1:{0}/api/v2.0'.format(server.server_port)
+    with mock.patch('resultsdbupdater.config.RESULTSDB_API_URL', url):
+        yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def client(resultsdb):
+    client = AsyncResultsDBClient(max_in_flight=4, max_pending=8)
+    client.start()
+    yield client
+    client.stop()
+
+
+def test_submit_results(resultsdb, client):
+    msg = mock.Mock(trace=None)
+    for i in range(20):
+        client.submit_result(msg, json.dumps({'testcase': str(i)}))
+    client.join()
+
+    posted = sorted(payload['testcase'] for _, _, payload in resultsdb.requests)
+    assert posted == sorted(str(i) for i in range(20))
+    msg.log.error.assert_not_called()
+    msg.log.exception.assert_not_called()
+
+
+def test_submit_result_rejected(resultsdb, client):
+    msg = mock.Mock(trace=None)
+    client.submit_result(msg, json.dumps({'outcome': 'INVALID'}))
+    client.join()
+
+    msg.log.error.assert_called_once()
+    assert 'Invalid outcome' in str(msg.log.error.call_args[0][1])
+
+
+def test_query_first_group(resultsdb, client):
+    assert client.query_first_group('https://example.com/run/1') == {}
+
+    resultsdb.groups = [{'uuid': 'uuid-1'}]
+    assert client.query_first_group('https://example.com/run/1') == {'uuid': 'uuid-1'}
+    assert resultsdb.requests[0][1] == (
+        '/api/v2.0/groups?description=https://example.com/run/1')
+
+
+def test_consumer_asyncio_mode(resultsdb):
+    utils.GROUP_CACHE.clear()
+    resultsdb.groups = [{'uuid': 'uuid-1'}]
+    with mock.patch('resultsdbupdater.config.RESULTSDB_CLIENT', 'asyncio'):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+
+    try:
+        consumer.consume(get_fake_msg('rpmdiff_message'))
+        consumer.async_client.join()
+    finally:
+        consumer.stop()
+
+    assert utils.submit_result == utils.post_result
+    assert utils.query_first_group == utils.fetch_first_group
+    assert [method for method, _, _ in resultsdb.requests] == ['GET', 'POST']
+    assert resultsdb.requests[1][2]['groups'][0]['uuid'] == 'uuid-1'
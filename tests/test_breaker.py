@@ -0,0 +1,91 @@
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import exceptions, utils
+from resultsdbupdater.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def timer():
+    return mock.Mock(return_value=100.0)
+
+
+@pytest.fixture
+def breaker(timer):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=10, timer=timer)
+
+
+def fail(breaker, count=1):
+    for _ in range(count):
+        breaker.allow()
+        breaker.record_failure(requests.exceptions.ConnectionError())
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    fail(breaker, 2)
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+    with pytest.raises(exceptions.CircuitOpenError):
+        breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_breaker_ignores_rejected_results(breaker):
+    for _ in range(5):
+        breaker.allow()
+        breaker.record_failure(exceptions.CreateResultError('Bad request', '{}'))
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_breaker_half_open_probe_success(breaker, timer):
+    fail(breaker, 3)
+    timer.return_value += 10
+    assert breaker.state == HALF_OPEN
+
+    # Only single probe request is allowed
+    breaker.allow()
+    with pytest.raises(exceptions.CircuitOpenError):
+        breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.allow()
+
+
+def test_breaker_half_open_probe_failure(breaker, timer):
+    fail(breaker, 3)
+    timer.return_value += 10
+    fail(breaker)
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+
+    timer.return_value += 9
+    assert breaker.state == OPEN
+    timer.return_value += 1
+    assert breaker.state == HALF_OPEN
+
+
+def test_post_result_fails_fast(breaker):
+    msg = mock.Mock()
+    with mock.patch('resultsdbupdater.utils.CIRCUIT_BREAKER', breaker), \
+            mock.patch('resultsdbupdater.utils.session') as mock_session:
+        mock_session.post.side_effect = requests.exceptions.ConnectionError()
+        mock_session.get.side_effect = requests.exceptions.ConnectionError()
+        for _ in range(3):
+            with pytest.raises(requests.exceptions.ConnectionError):
+                utils.post_result(msg, '{}')
+
+        with pytest.raises(exceptions.CircuitOpenError):
+            utils.post_result(msg, '{}')
+        with pytest.raises(exceptions.CircuitOpenError):
+            utils.fetch_first_group('https://example.com/run/1')
+
+    assert mock_session.post.call_count == 3
+    mock_session.get.assert_not_called()
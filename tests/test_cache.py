@@ -0,0 +1,119 @@
+import threading
+
+import mock
+import pytest
+
+from resultsdbupdater.cache import SingleFlight, TTLCache
+
+
+def test_cache_hit_and_miss():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.get('b', 2) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_expires_items():
+    timer = mock.Mock(return_value=100)
+    cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+    cache.set('a', 1)
+
+    timer.return_value = 159
+    assert cache.get('a') == 1
+
+    timer.return_value = 160
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert len(cache) == 2
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_cache_clear():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.clear()
+    assert cache.get('a') is None
+    assert (len(cache), cache.hits, cache.misses) == (0, 0, 1)
+
+
+def _run_concurrently(count, fn):
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_for_waiters(flight, count):
+    while flight.shared < count:
+        threading.Event().wait(0.001)
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    fn = mock.Mock(side_effect=lambda: release.wait() and 'value')
+
+    threads, results = _run_concurrently(5, lambda: flight.do('key', fn))
+    _wait_for_waiters(flight, 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    fn.assert_called_once()
+    assert results == ['value'] * 5
+
+
+def test_single_flight_shares_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError('lookup failed')
+
+    def fn():
+        release.wait()
+        raise error
+
+    threads, results = _run_concurrently(3, lambda: flight.do('key', fn))
+    _wait_for_waiters(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [error] * 3
+
+
+def test_single_flight_sequential_calls():
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flight.do('key', mock.Mock(side_effect=ValueError))
+    assert flight.shared == 0
@@ -0,0 +1,43 @@
+import json
+
+import mock
+import pytest
+
+from resultsdbupdater import codec
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request):
+    if request.param == 'json':
+        with mock.patch('resultsdbupdater.codec.orjson', None):
+            yield request.param
+    else:
+        pytest.importorskip('orjson')
+        yield request.param
+
+
+@pytest.mark.parametrize('obj', [
+    {'testcase': {'name': 'a.b'}, 'data': {'item': ['x', 'y'], 'note': 'příliš'}},
+    {'big': 2 ** 70},
+    [],
+])
+def test_dumps_loads(backend, obj):
+    assert codec.backend() == backend
+    text = codec.dumps(obj)
+    assert isinstance(text, str)
+    assert json.loads(text) == obj
+    assert codec.loads(text) == obj
+    assert codec.loads(codec.encode(text)) == obj
+
+
+def test_dumps_non_str_keys(backend):
+    assert json.loads(codec.dumps({1: 'a'})) == {'1': 'a'}
+
+
+def test_dumps_default(backend):
+    assert json.loads(codec.dumps({'a': object}, default=lambda obj: 'x')) == {'a': 'x'}
+
+
+def test_loads_invalid(backend):
+    with pytest.raises(ValueError):
+        codec.loads('{"id": 1, "pay')
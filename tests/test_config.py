@@ -1,3 +1,6 @@
+import importlib
+
+import mock
 import pytest
 
 from resultsdbupdater import config
@@ -24,3 +27,19 @@ def test_get_http_auth(user, password, url, result, error):
     else:
         auth = config.get_http_auth(user, password, url)
         assert auth == result
+
+
+@pytest.mark.parametrize(('options', 'retries'), [
+    ({}, 24),
+    ({'resultsdb-updater.retry_queue': True}, 2),
+    ({'resultsdb-updater.circuit_breaker_threshold': 5}, 2),
+    ({'resultsdb-updater.circuit_breaker_threshold': 5,
+      'resultsdb-updater.session_retries': 10}, 10),
+])
+def test_session_retries(options, retries):
+    try:
+        with mock.patch('fedmsg.config.load_config', return_value=options):
+            importlib.reload(config)
+        assert config.SESSION_RETRIES == retries
+    finally:
+        importlib.reload(config)
@@ -1,19 +1,20 @@
 from __future__ import unicode_literals
 from os import path
 import json
+import logging
 
 import pytest
 import mock
 import requests
+import semantic_version
 
 import resultsdbupdater.utils
-from resultsdbupdater.message import create_message
+from resultsdbupdater.message import (
+    REQUIRED_FIELD, Message, MessageV2, MessageV2_1, compile_path, create_message)
 
 from resultsdbupdater import consumer as ciconsumer
 
-
-class FakeHub(object):
-    config = {}
+from .conftest import FakeHub
 
 
 json_dir = path.join(path.abspath(path.dirname(__file__)), 'fake_messages')
@@ -24,12 +25,6 @@ uuid_patcher = mock.patch(
 uuid_patcher.start()
 
 
-@pytest.fixture
-def mock_session():
-    with mock.patch('resultsdbupdater.utils.session') as mocked:
-        yield mocked
-
-
 def get_fake_msg(name):
     fake_msg_path = path.join(json_dir, name + '.json')
     with open(fake_msg_path) as fake_msg_file:
@@ -197,6 +192,23 @@ def test_full_consume_rpmdiff_msg(mock_session):
         json.loads(mock_session.post.call_args_list[0][1]['data'])
 
 
+def test_full_consume_rpmdiff_msgs_same_group(mock_session):
+    mock_session.get.return_value.json.return_value = {'data': []}
+
+    consumer.consume(get_fake_msg('rpmdiff_message_two'))
+    consumer.consume(get_fake_msg('rpmdiff_message'))
+
+    # The group is queried only for the first result
+    mock_session.get.assert_called_once()
+    assert mock_session.post.call_count == 2
+    groups = [
+        json.loads(args[1]['data'])['groups']
+        for args in mock_session.post.call_args_list
+    ]
+    assert groups[0] == groups[1]
+    assert resultsdbupdater.utils.GROUP_CACHE.hits == 1
+
+
 def test_full_consume_rpmdiff_msg_with_bad_ref_url(mock_session, caplog):
     fake_msg = get_fake_msg('rpmdiff_message')
     fake_msg['body']['msg']['ref_url'] = 'https://example.com/bad/123'
@@ -1164,6 +1176,113 @@ def test_consume_no_exception_on_bad_message(caplog):
     assert 'Failed to parse message version' in caplog.text
 
 
+@pytest.mark.parametrize(('name', 'topic', 'route'), (
+    ('redhat-container-image.test.complete', None, ciconsumer.ROUTE_CI_UMB),
+    ('bulk_results_message', None, ciconsumer.ROUTE_RESULTSDB),
+    ('message', None, ciconsumer.ROUTE_CI_METRICS),
+    ('bogus', '/topic/VirtualTopic.eng.other', ciconsumer.ROUTE_UNHANDLED),
+    # Unhandled messages are not logged for this topic
+    ('bogus', None, ciconsumer.ROUTE_UNHANDLED),
+))
+def test_classify_message(mock_session, caplog, name, topic, route):
+    mock_session.get.return_value.json.return_value = {'data': []}
+    fake_msg = get_fake_msg(name)
+    if topic is not None:
+        fake_msg['topic'] = topic
+
+    msg = create_message(fake_msg)
+    assert ciconsumer.classify_message(msg) == route
+
+    with mock.patch('resultsdbupdater.metrics.MESSAGES.inc') as inc:
+        consumer.consume(fake_msg)
+    inc.assert_called_once_with(route)
+
+    unhandled_warning = 'Received unhandled message' in caplog.text
+    assert unhandled_warning == (route == ciconsumer.ROUTE_UNHANDLED and topic is not None)
+
+
+def test_classify_non_dict_message(caplog):
+    caplog.set_level(logging.DEBUG)
+    fake_msg = get_fake_msg('message')
+    fake_msg['body']['msg'] = ''
+    assert ciconsumer.classify_message(create_message(fake_msg)) == ciconsumer.ROUTE_DROPPED
+    consumer.consume(fake_msg)
+    assert 'Dropping non-dict message.' in caplog.text
+
+
+@pytest.mark.parametrize(('version', 'message_class'), (
+    ('0.1.0', Message),
+    ('0.2.0', MessageV2),
+    ('0.2.1', MessageV2_1),
+    ('1.0.0', MessageV2_1),
+))
+def test_create_message_version_cached(version, message_class):
+    fake_msg = get_fake_msg('message')
+    fake_msg['body']['msg']['version'] = version
+    with mock.patch('resultsdbupdater.message._message_classes', {}), \
+            mock.patch('semantic_version.match', wraps=semantic_version.match) as match:
+        assert type(create_message(fake_msg)) is message_class
+        calls = match.call_count
+        assert type(create_message(fake_msg)) is message_class
+
+    assert match.call_count == calls
+
+
+@pytest.mark.parametrize('path', (
+    ('a',), ('a', 'b'), ('a', 'b', 'c'), ('x',), ('a', 'x'), ('a', 'b', 'x'), ('s', 'x'),
+))
+@pytest.mark.parametrize('default', (None, {'b': 'from default'}, REQUIRED_FIELD))
+def test_compile_path(path, default):
+    def reference_get(value, default):
+        for key in path:
+            if not isinstance(value, dict):
+                return default
+            value = value.get(key, default)
+        return value
+
+    value = {'a': {'b': {'c': 'found'}}, 's': 'string'}
+    assert compile_path(path)(value, default) == reference_get(value, default)
+    assert compile_path(path)('string', default) == default
+
+
+def test_create_message_invalid_version_cached(caplog):
+    fake_msg = get_fake_msg('message')
+    fake_msg['body']['msg']['version'] = 'bad'
+    with mock.patch('resultsdbupdater.message._message_classes', {}), \
+            mock.patch('semantic_version.match', wraps=semantic_version.match) as match:
+        for _ in range(2):
+            assert type(create_message(fake_msg)) is Message
+
+    assert match.call_count == 1
+    assert caplog.text.count('Failed to parse message version') == 2
+
+
+@pytest.mark.parametrize('name', ('container_image_message', 'brew-build.test.error.v2'))
+def test_message_values_cached(name):
+    msg = create_message(get_fake_msg(name))
+    message_class = type(msg)
+    assert msg.result is msg.result
+
+    with mock.patch.object(
+            message_class, 'contact', autospec=True, side_effect=message_class.contact) as contact:
+        assert msg.contact_dict is msg.contact_dict
+    assert contact.call_count == 5
+
+    result_class = type(msg.result)
+    with mock.patch.object(
+            result_class, 'category', new_callable=mock.PropertyMock,
+            return_value='functional') as category:
+        assert msg.result.testcase == msg.result.testcase
+    assert category.call_count == 1
+
+
+@pytest.mark.parametrize('name', ('container_image_message', 'brew-build.test.error.v2'))
+def test_message_without_dict(name):
+    msg = create_message(get_fake_msg(name))
+    for obj in (msg, msg.result, msg.log):
+        assert not hasattr(obj, '__dict__')
+
+
 def test_fedora_ci_message_brew_build_test_complete_version_2(mock_session):
     fake_msg = get_fake_msg('fedora-ci-message-brew-build.test.complete-2.0.0')
     consumer.consume(fake_msg)
@@ -1267,6 +1386,13 @@ def test_consuming_invalid_messages(mock_session, caplog):
     consumer.consume({})
 
 
+@pytest.mark.parametrize('msg_data', ['garbage', None, [1], {'body': 'garbage'}])
+def test_consuming_non_dict_messages(mock_session, caplog, msg_data):
+    consumer.consume(msg_data)
+    assert 'Unexpected exception' not in caplog.text
+    assert not mock_session.post.called
+
+
 def test_results_create_failed(mock_session, caplog):
     fake_msg = get_fake_msg('osci_success_message')
 
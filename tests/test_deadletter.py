@@ -0,0 +1,212 @@
+import json
+
+import mock
+import pytest
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import exceptions, replay, utils
+from resultsdbupdater.deadletter import DeadLetterStore, handle_error
+from resultsdbupdater.message import create_message
+from resultsdbupdater.pipeline import ResultPipeline
+from resultsdbupdater.spool import SpooledPayload
+
+from .conftest import FakeHub
+from .test_consumer import consumer, get_fake_msg
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DeadLetterStore(str(tmp_path))
+    with mock.patch('resultsdbupdater.deadletter.DEAD_LETTERS', store):
+        yield store
+
+
+def test_store_appends_records(store):
+    fake_msg = get_fake_msg('message')
+    fake_msg['headers']['message-id'] = 'ID:host/1'
+    msg = create_message(fake_msg)
+    store.store(msg, exceptions.CreateResultError('Bad request', '{"n": 1}'))
+    store.store(msg, exceptions.CreateResultError('Bad request', '{"n": 2}'))
+
+    entries = store.find()
+    assert [entry[:2] for entry in entries] == [('CreateResultError', 'ID:host/1')]
+
+    records = store.load(entries[0][2])
+    assert [record['payload'] for record in records] == ['{"n": 1}', '{"n": 2}']
+    assert records[0]['message'] == msg.msg_data
+    assert records[0]['error'] == 'Failed to create result: Bad request; Payload: {"n": 1}'
+
+
+def test_find_filters(store):
+    msg = create_message(get_fake_msg('message'))
+    store.store(msg, exceptions.InvalidMessageError('Invalid'))
+    store.store(msg, exceptions.CreateResultError('Bad request', '{}'))
+
+    assert [entry[0] for entry in store.find()] == [
+        'CreateResultError', 'InvalidMessageError']
+    assert [entry[0] for entry in store.find(['InvalidMessageError'])] == [
+        'InvalidMessageError']
+    assert store.find(msg_ids=['ID:OTHER']) == []
+
+
+@pytest.mark.parametrize('error, level, stored', [
+    (exceptions.CreateResultError('Bad request', '{}'), 'ERROR', ['CreateResultError']),
+    (exceptions.InvalidMessageError('Invalid'), 'WARNING', ['InvalidMessageError']),
+    (exceptions.CircuitOpenError(), 'ERROR', ['CircuitOpenError']),
+    (ValueError('Bug'), 'ERROR', []),
+])
+def test_handle_error(store, caplog, error, level, stored):
+    msg = create_message(get_fake_msg('message'))
+    try:
+        raise error
+    except Exception as e:
+        handle_error(msg, e)
+
+    assert [record.levelname for record in caplog.records] == [level]
+    assert [entry[0] for entry in store.find()] == stored
+
+
+def test_consumer_stores_rejected_results(mock_session, store):
+    mock_session.post.return_value.json.return_value = {'message': 'Dummy failure message'}
+    mock_session.post.return_value.status_code = 400
+    consumer.consume(get_fake_msg('osci_success_message'))
+
+    fake_msg = get_fake_msg('redhat_module_message')
+    fake_msg['body']['msg']['artifact']['nsvc'] = 'BAD_FORMAT'
+    consumer.consume(fake_msg)
+
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['CreateResultError', 'InvalidMessageError']
+    rejected, invalid = [store.load(entry[2]) for entry in entries]
+    assert json.loads(rejected[0]['payload'])['testcase']['name'] == 'osci.pipeline.functional'
+    assert invalid[0]['payload'] is None
+    assert invalid[0]['message'] == fake_msg
+
+
+def test_replay(mock_session, store):
+    msg = create_message(get_fake_msg('message'))
+    store.store(msg, exceptions.CreateResultError('Bad request', '{"n": 1}'))
+    store.store(msg, exceptions.CreateResultError('Bad request', '{"n": 2}'))
+    store.store(msg, exceptions.InvalidMessageError('Invalid'))
+
+    assert replay.main(['--dir', store.directory, '--error', 'CreateResultError']) == 0
+    assert [json.loads(args[1]['data']) for args in mock_session.post.call_args_list] == [
+        {'n': 1}, {'n': 2}]
+    assert [entry[0] for entry in store.find()] == ['InvalidMessageError']
+
+    # Messages without results are processed again
+    mock_session.post.reset_mock()
+    assert replay.main(['--dir', store.directory]) == 0
+    assert mock_session.post.call_count == 2
+    assert store.find() == []
+
+
+def test_replay_keeps_failed(mock_session, store):
+    mock_session.post.return_value.json.return_value = {'message': 'Dummy failure message'}
+    mock_session.post.return_value.status_code = 400
+    msg = create_message(get_fake_msg('message'))
+    store.store(msg, exceptions.CreateResultError('Bad request', '{}'))
+
+    assert replay.main(['--dir', store.directory, '--workers', '2']) == 1
+    assert len(store.find()) == 1
+
+
+def test_replay_keeps_only_failed_results(mock_session, store):
+    rejected = mock.Mock(status_code=400)
+    rejected.json.return_value = {'message': 'Dummy failure message'}
+    mock_session.post.side_effect = [mock.Mock(status_code=201), rejected, rejected]
+    msg = create_message(get_fake_msg('message'))
+    for n in range(3):
+        store.store(msg, exceptions.CreateResultError('Bad request', '{"n": %s}' % n))
+
+    assert replay.main(['--dir', store.directory]) == 1
+    assert mock_session.post.call_count == 3
+    entries = store.find()
+    assert len(entries) == 1
+    assert [record['payload'] for record in store.load(entries[0][2])] == [
+        '{"n": 1}', '{"n": 2}']
+
+    # Accepted result is not posted again
+    mock_session.post.reset_mock()
+    mock_session.post.side_effect = None
+    mock_session.post.return_value.status_code = 201
+    assert replay.main(['--dir', store.directory]) == 0
+    assert [json.loads(args[1]['data']) for args in mock_session.post.call_args_list] == [
+        {'n': 1}, {'n': 2}]
+    assert store.find() == []
+
+
+@pytest.mark.parametrize('max_in_flight', (1, 4))
+def test_batch_stores_all_rejected_results(mock_session, store, max_in_flight):
+    mock_session.post.return_value.json.return_value = {'message': 'Dummy failure message'}
+    mock_session.post.return_value.status_code = 400
+    with mock.patch('resultsdbupdater.config.BATCH_MAX_IN_FLIGHT', max_in_flight):
+        consumer.consume(get_fake_msg('bulk_results_message'))
+
+    assert mock_session.post.call_count == 3
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['CreateResultError']
+    payloads = [json.loads(record['payload']) for record in store.load(entries[0][2])]
+    assert sorted(payload['testcase'] for payload in payloads) == sorted(
+        get_fake_msg('bulk_results_message')['body']['msg']['results'])
+
+
+def test_consumer_stores_messages_while_resultsdb_unavailable(mock_session, store):
+    breaker = mock.Mock()
+    breaker.call.side_effect = exceptions.CircuitOpenError()
+    utils.GROUP_CACHE.clear()
+    fake_msg = get_fake_msg('rpmdiff_message')
+    with mock.patch('resultsdbupdater.utils.CIRCUIT_BREAKER', breaker):
+        # Group lookup fails
+        consumer.consume(fake_msg)
+
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['CircuitOpenError']
+    records = store.load(entries[0][2])
+    assert records[0]['payload'] is None
+
+    # Message is processed again
+    mock_session.get.return_value.json.return_value = {'data': []}
+    assert replay.main(['--dir', store.directory]) == 0
+    assert mock_session.post.call_count == 1
+    assert store.find() == []
+
+
+def test_consumer_keeps_spooled_results_while_resultsdb_unavailable(
+        mock_session, store, tmp_path):
+    def call(fn, *args, **kwargs):
+        if fn.__name__ == 'post_result':
+            raise exceptions.CircuitOpenError()
+        return fn(*args, **kwargs)
+
+    breaker = mock.Mock()
+    breaker.call.side_effect = call
+    spool_dir = str(tmp_path / 'spool')
+    with mock.patch('resultsdbupdater.utils.CIRCUIT_BREAKER', breaker), \
+            mock.patch('resultsdbupdater.config.SPOOL_DIR', spool_dir):
+        spooled_consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            spooled_consumer.consume(get_fake_msg('container_image_message'))
+            assert len(spooled_consumer.spool) == 1
+        finally:
+            spooled_consumer.stop()
+
+    # Result is posted again from the spool only
+    assert store.find() == []
+
+
+def test_pipeline_stores_results_while_resultsdb_unavailable(store):
+    post = mock.Mock(side_effect=exceptions.CircuitOpenError())
+    pipeline = ResultPipeline(workers=1, queue_size=10, post=post)
+    msg = create_message(get_fake_msg('message'))
+    spooled = SpooledPayload('{"n": 2}')
+    spooled.spool_id = 1
+    pipeline.put(msg, '{"n": 1}')
+    pipeline.put(msg, spooled)
+    pipeline.start()
+    pipeline.stop()
+
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['CircuitOpenError']
+    # Spooled result is posted again after restart
+    assert [record['payload'] for record in store.load(entries[0][2])] == ['{"n": 1}']
@@ -0,0 +1,68 @@
+import mock
+import pytest
+
+from resultsdbupdater import utils
+from resultsdbupdater.group_index import GroupIndex
+
+
+@pytest.fixture
+def timer():
+    return mock.Mock(return_value=1000.0)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / 'groups.sqlite')
+
+
+def test_group_index_persists_groups(index_path, timer):
+    index = GroupIndex(index_path, max_entries=10, max_age=60, timer=timer)
+    index.set('https://example.com/run/1', 'uuid-1')
+    assert index.get('https://example.com/run/1') == 'uuid-1'
+    assert index.get('https://example.com/run/2') is None
+    index.close()
+
+    index = GroupIndex(index_path, max_entries=10, max_age=60, timer=timer)
+    assert index.get('https://example.com/run/1') == 'uuid-1'
+
+
+def test_group_index_expires_groups(index_path, timer):
+    index = GroupIndex(index_path, max_entries=10, max_age=60, timer=timer)
+    index.set('a', 'uuid-a')
+
+    timer.return_value += 60
+    assert index.get('a') is None
+
+    index.prune()
+    assert len(index) == 0
+
+
+def test_group_index_prunes_oldest_groups(index_path, timer):
+    index = GroupIndex(index_path, max_entries=2, max_age=60, timer=timer)
+    for name in 'abc':
+        timer.return_value += 1
+        index.set(name, 'uuid-' + name)
+
+    index.prune()
+    assert len(index) == 2
+    assert index.get('a') is None
+    assert index.get('c') == 'uuid-c'
+
+
+def test_get_first_group_from_index(index_path):
+    index = GroupIndex(index_path, max_entries=10, max_age=60)
+    index.set('https://example.com/run/1', 'uuid-1')
+    utils.GROUP_CACHE.clear()
+
+    with mock.patch('resultsdbupdater.utils.GROUP_INDEX', index), \
+            mock.patch('resultsdbupdater.utils.session') as mock_session:
+        mock_session.get.return_value.json.return_value = {
+            'data': [{'uuid': 'uuid-2', 'description': 'https://example.com/run/2'}]
+        }
+        assert utils.get_first_group('https://example.com/run/1')['uuid'] == 'uuid-1'
+        mock_session.get.assert_not_called()
+
+        assert utils.get_first_group('https://example.com/run/2')['uuid'] == 'uuid-2'
+        mock_session.get.assert_called_once()
+
+    assert index.get('https://example.com/run/2') == 'uuid-2'
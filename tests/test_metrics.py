@@ -0,0 +1,153 @@
+import urllib.request
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import exceptions, metrics
+from resultsdbupdater.breaker import CircuitBreaker
+
+from .conftest import FakeHub
+from .test_consumer import get_fake_msg
+
+
+def test_counter():
+    counter = metrics.Counter('test_total', 'Test counter', ('route',), registry=[])
+    counter.inc('a')
+    counter.inc('a', amount=2)
+    counter.inc('b')
+
+    assert counter.value('a') == 3
+    assert counter.value('c') == 0
+    assert counter.values() == {('a',): 3, ('b',): 1}
+    assert counter.render() == (
+        '# HELP test_total Test counter\n'
+        '# TYPE test_total counter\n'
+        'test_total{route="a"} 3\n'
+        'test_total{route="b"} 1\n'
+    )
+
+    counter.reset()
+    assert counter.values() == {}
+
+
+def test_counter_without_labels():
+    counter = metrics.Counter('test_total', 'Test counter', registry=[])
+    assert counter.render().endswith('\ntest_total 0\n')
+    counter.inc(amount=1.5)
+    assert counter.render().endswith('\ntest_total 1.5\n')
+
+
+def test_histogram():
+    histogram = metrics.Histogram(
+        'test_seconds', 'Test histogram', ('operation',), buckets=(0.1, 1), registry=[])
+    histogram.observe(0.1, 'get')
+    histogram.observe(0.5, 'get')
+    histogram.observe(5, 'get')
+    with mock.patch('time.monotonic', side_effect=[10, 10.25]):
+        with histogram.time('post'):
+            pass
+
+    assert histogram.count('get') == 3
+    assert histogram.render() == (
+        '# HELP test_seconds Test histogram\n'
+        '# TYPE test_seconds histogram\n'
+        'test_seconds_bucket{operation="get",le="0.1"} 1\n'
+        'test_seconds_bucket{operation="get",le="1"} 2\n'
+        'test_seconds_bucket{operation="get",le="+Inf"} 3\n'
+        'test_seconds_sum{operation="get"} 5.6\n'
+        'test_seconds_count{operation="get"} 3\n'
+        'test_seconds_bucket{operation="post",le="0.1"} 0\n'
+        'test_seconds_bucket{operation="post",le="1"} 1\n'
+        'test_seconds_bucket{operation="post",le="+Inf"} 1\n'
+        'test_seconds_sum{operation="post"} 0.25\n'
+        'test_seconds_count{operation="post"} 1\n'
+    )
+
+
+def test_gauge():
+    gauge = metrics.Gauge('test_size', 'Test gauge', ('queue',), registry=[])
+    gauge.set_function(lambda: 3, 'retry')
+    gauge.set_function(lambda: 1, 'a"b')
+    assert gauge.render().endswith(
+        'test_size{queue="a\\"b"} 1\n'
+        'test_size{queue="retry"} 3\n'
+    )
+
+    gauge.remove('retry')
+    assert 'retry' not in gauge.render()
+
+
+def test_function_counter():
+    counter = metrics.FunctionCounter('test_total', 'Test counter', registry=[])
+    counter.set_function(lambda: 2)
+    assert counter.render() == (
+        '# HELP test_total Test counter\n'
+        '# TYPE test_total counter\n'
+        'test_total 2\n'
+    )
+
+
+def test_http_server():
+    server = metrics.start_http_server(0, '127.0.0.1')
+    try:
+        url = 'http://127.0.0.1:{0}/metrics'.format(server.server_address[1])
+        with urllib.request.urlopen(url) as response:
+            assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+            body = response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert '# TYPE resultsdb_updater_messages_total counter\n' in body
+    assert '# TYPE resultsdb_updater_request_duration_seconds histogram\n' in body
+
+
+def test_consumer_metrics(mock_session):
+    with mock.patch('resultsdbupdater.config.PIPELINE_WORKERS', 1):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            messages = metrics.MESSAGES.value(ciconsumer.ROUTE_CI_UMB)
+            results = metrics.RESULTS.value('container-image', 'PASSED')
+            requests = metrics.REQUEST_DURATION.count('create_result')
+            durations = metrics.MESSAGE_DURATION.count()
+
+            consumer.consume(get_fake_msg('container_image_message'))
+            consumer.pipeline.join()
+
+            assert 'resultsdb_updater_queue_size{queue="pipeline"} 0\n' in metrics.render()
+        finally:
+            consumer.stop()
+
+    assert metrics.MESSAGES.value(ciconsumer.ROUTE_CI_UMB) == messages + 1
+    assert metrics.RESULTS.value('container-image', 'PASSED') == results + 1
+    assert metrics.REQUEST_DURATION.count('create_result') == requests + 1
+    assert metrics.MESSAGE_DURATION.count() == durations + 1
+    assert 'queue="pipeline"' not in metrics.render()
+
+
+def test_consumer_breaker_and_cache_metrics():
+    breaker = CircuitBreaker(1, 60)
+    breaker.record_failure(requests.exceptions.ConnectionError())
+    with mock.patch('resultsdbupdater.utils.CIRCUIT_BREAKER', breaker), \
+            mock.patch('resultsdbupdater.utils.GROUP_CACHE.hits', 3), \
+            mock.patch('resultsdbupdater.utils.GROUP_CACHE.misses', 1):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            with pytest.raises(exceptions.CircuitOpenError):
+                breaker.allow()
+            rendered = metrics.render()
+        finally:
+            consumer.stop()
+
+    assert 'resultsdb_updater_circuit_breaker_state{state="open"} 1\n' in rendered
+    assert 'resultsdb_updater_circuit_breaker_state{state="closed"} 0\n' in rendered
+    assert 'resultsdb_updater_circuit_breaker_opened_total 1\n' in rendered
+    assert 'resultsdb_updater_circuit_breaker_rejected_total 1\n' in rendered
+    assert 'resultsdb_updater_group_cache_lookups_total{result="hit"} 3\n' in rendered
+    assert 'resultsdb_updater_group_cache_lookups_total{result="miss"} 1\n' in rendered
+
+    rendered = metrics.render()
+    assert 'resultsdb_updater_circuit_breaker_state{' not in rendered
+    assert 'resultsdb_updater_group_cache_lookups_total{' not in rendered
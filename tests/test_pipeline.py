@@ -0,0 +1,98 @@
+import json
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import utils
+from resultsdbupdater.pipeline import ResultPipeline
+
+from .conftest import FakeHub
+from .test_consumer import get_fake_msg
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = ResultPipeline(workers=3, queue_size=2)
+    pipeline.start()
+    yield pipeline
+    pipeline.stop()
+
+
+def test_pipeline_posts_results(mock_session, pipeline):
+    msg = mock.Mock(trace=None)
+    for i in range(10):
+        pipeline.put(msg, json.dumps({'testcase': str(i)}))
+    pipeline.join()
+
+    assert mock_session.post.call_count == 10
+    posted = sorted(
+        json.loads(args[1]['data'])['testcase']
+        for args in mock_session.post.call_args_list)
+    assert posted == sorted(str(i) for i in range(10))
+
+
+def test_pipeline_survives_errors(mock_session, pipeline):
+    error = requests.exceptions.Timeout()
+    mock_session.post.side_effect = [
+        error,
+        mock.Mock(status_code=201),
+    ]
+    msg = mock.Mock(trace=None)
+    pipeline.put(msg, '{}')
+    pipeline.put(msg, '{}')
+    pipeline.join()
+
+    assert mock_session.post.call_count == 2
+    msg.log.exception.assert_called_once_with('Unexpected exception', exc_info=error)
+
+
+def test_pipeline_stop_processes_queued_results(mock_session):
+    pipeline = ResultPipeline(workers=1, queue_size=10)
+    msg = mock.Mock(trace=None)
+    for _ in range(5):
+        pipeline.put(msg, '{}')
+
+    pipeline.start()
+    pipeline.stop()
+    assert mock_session.post.call_count == 5
+    assert not any(thread.is_alive() for thread in pipeline.threads)
+
+
+def test_consumer_pipeline_mode(mock_session):
+    with mock.patch('resultsdbupdater.config.PIPELINE_WORKERS', 2):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+
+    try:
+        assert utils.submit_result == consumer.pipeline.put
+        consumer.consume(get_fake_msg('message'))
+        consumer.pipeline.join()
+    finally:
+        consumer.stop()
+
+    assert utils.submit_result == utils.post_result
+    assert mock_session.post.call_count == 2
+
+
+def test_consumer_pipeline_with_retry_queue(mock_session):
+    mock_session.post.side_effect = [
+        requests.exceptions.ConnectionError(),
+        mock.Mock(status_code=201),
+        mock.Mock(status_code=201),
+    ]
+    with mock.patch('resultsdbupdater.config.PIPELINE_WORKERS', 1), \
+            mock.patch('resultsdbupdater.config.RETRY_QUEUE', True), \
+            mock.patch('resultsdbupdater.config.RETRY_BACKOFF_FACTOR', 0):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+
+    try:
+        assert consumer.pipeline.post == consumer.retry_queue.submit
+        consumer.consume(get_fake_msg('message'))
+        consumer.pipeline.join()
+        while len(consumer.retry_queue) or consumer.retry_queue.retries == 0:
+            consumer.retry_queue.thread.join(0.001)
+    finally:
+        consumer.stop()
+
+    assert mock_session.post.call_count == 3
@@ -0,0 +1,84 @@
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+
+import mock
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater.profiler import Profiler, collapse_stack
+
+from .conftest import FakeHub
+
+
+def busy_function(stop):
+    stop.wait()
+
+
+def read_stacks(directory, suffix='.collapsed'):
+    paths = [name for name in os.listdir(directory) if name.endswith(suffix)]
+    assert len(paths) == 1
+    with open(os.path.join(directory, paths[0])) as f:
+        return dict(line.rsplit(' ', 1) for line in f.read().splitlines())
+
+
+def test_collapse_stack():
+    def inner():
+        return collapse_stack('Main;Thread', sys._getframe(), {})
+
+    stack = inner().split(';')
+    assert stack[0] == 'Main:Thread'
+    assert stack[-2].startswith('test_collapse_stack (test_profiler.py:')
+    assert stack[-1].startswith('inner (test_profiler.py:')
+
+
+def test_profiler(tmp_path):
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_function, args=(stop,), name='Busy')
+    thread.start()
+    try:
+        profiler = Profiler(str(tmp_path), duration=0.05, interval=0.01)
+        assert profiler.start()
+        assert not profiler.start()
+        profiler.join()
+    finally:
+        stop.set()
+        thread.join()
+
+    stacks = read_stacks(str(tmp_path))
+    busy = [
+        int(count) for stack, count in stacks.items()
+        if stack.startswith('Busy;') and 'busy_function (test_profiler.py:' in stack
+    ]
+    assert len(busy) == 1
+    assert busy[0] >= 5
+    assert not any(stack.startswith('Profiler;') for stack in stacks)
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiler_tracemalloc(tmp_path):
+    profiler = Profiler(str(tmp_path), duration=0.01, trace_malloc=True)
+    profiler.start()
+    profiler.join()
+
+    assert not tracemalloc.is_tracing()
+    paths = [name for name in os.listdir(str(tmp_path)) if name.endswith('.tracemalloc')]
+    assert len(paths) == 1
+    snapshot = tracemalloc.Snapshot.load(os.path.join(str(tmp_path), paths[0]))
+    assert snapshot.traceback_limit == 25
+
+
+def test_consumer_profiles_on_signal(tmp_path):
+    with mock.patch('resultsdbupdater.config.PROFILE_DIR', str(tmp_path)), \
+            mock.patch('resultsdbupdater.config.PROFILE_DURATION', 0.01):
+        previous = signal.getsignal(signal.SIGUSR2)
+        consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            os.kill(os.getpid(), signal.SIGUSR2)
+            consumer.profiler.join()
+        finally:
+            consumer.stop()
+
+    assert signal.getsignal(signal.SIGUSR2) is previous
+    assert read_stacks(str(tmp_path))
@@ -0,0 +1,155 @@
+import threading
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import exceptions
+from resultsdbupdater.deadletter import DeadLetterStore
+from resultsdbupdater.message import create_message
+from resultsdbupdater.retry import RetryQueue, is_retriable
+from resultsdbupdater.spool import SpooledPayload
+
+from .test_consumer import get_fake_msg
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+@pytest.mark.parametrize(('error', 'retriable'), [
+    (requests.exceptions.ConnectionError(), True),
+    (requests.exceptions.Timeout(), True),
+    (requests.exceptions.RetryError(), True),
+    (http_error(502), True),
+    (http_error(404), False),
+    (exceptions.CreateResultError('Bad request', '{}'), False),
+    (RuntimeError(), False),
+])
+def test_is_retriable(error, retriable):
+    assert is_retriable(error) == retriable
+
+
+def create_queue(post, **kwargs):
+    kwargs.setdefault('max_attempts', 3)
+    kwargs.setdefault('backoff_factor', 0.001)
+    kwargs.setdefault('max_backoff', 0.01)
+    kwargs.setdefault('maxsize', 10)
+    return RetryQueue(post, **kwargs)
+
+
+def test_retry_delay():
+    queue = create_queue(None, backoff_factor=1, max_backoff=5)
+    assert [queue.delay(attempt) for attempt in range(2, 7)] == [1, 2, 4, 5, 5]
+
+
+def test_retry_until_success():
+    done = threading.Event()
+    errors = [requests.exceptions.ConnectionError(), requests.exceptions.Timeout()]
+
+    def post(msg, payload):
+        if errors:
+            raise errors.pop(0)
+        done.set()
+
+    post = mock.Mock(side_effect=post)
+    msg = mock.Mock(trace=None)
+    queue = create_queue(post)
+    queue.start()
+    try:
+        queue.submit(msg, '{}')
+        assert done.wait(5)
+    finally:
+        queue.stop()
+
+    assert post.call_count == 3
+    assert queue.retries == 2
+    assert msg.log.warning.call_count == 2
+    msg.log.error.assert_not_called()
+
+
+def test_retry_gives_up():
+    msg = mock.Mock(trace=None)
+    post = mock.Mock(side_effect=requests.exceptions.ConnectionError())
+    queue = create_queue(post, max_attempts=1)
+    queue.submit(msg, '{}')
+
+    assert len(queue) == 0
+    assert 'Giving up' in msg.log.error.call_args[0][0]
+
+
+def test_retry_non_retriable_error_raised():
+    post = mock.Mock(side_effect=exceptions.CreateResultError('Bad request', '{}'))
+    queue = create_queue(post)
+    with pytest.raises(exceptions.CreateResultError):
+        queue.submit(mock.Mock(), '{}')
+    assert len(queue) == 0
+
+
+def test_retry_queue_full():
+    msg = mock.Mock(trace=None)
+    post = mock.Mock(side_effect=requests.exceptions.ConnectionError())
+    queue = create_queue(post, maxsize=1)
+    queue.submit(msg, '{}')
+    queue.submit(msg, '{}')
+
+    assert len(queue) == 1
+    assert 'Retry queue is full' in msg.log.error.call_args[0][0]
+
+
+def test_retry_gives_up_stores_result(tmp_path):
+    store = DeadLetterStore(str(tmp_path))
+    msg = create_message(get_fake_msg('message'))
+    spooled = SpooledPayload('{"n": 2}')
+    spooled.spool_id = 1
+    post = mock.Mock(side_effect=requests.exceptions.ConnectionError())
+    queue = create_queue(post, max_attempts=1)
+    with mock.patch('resultsdbupdater.deadletter.DEAD_LETTERS', store):
+        queue.submit(msg, '{"n": 1}')
+        queue.submit(msg, spooled)
+
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['ConnectionError']
+    assert [record['payload'] for record in store.load(entries[0][2])] == ['{"n": 1}']
+
+
+def test_retry_queue_full_stores_result(tmp_path):
+    store = DeadLetterStore(str(tmp_path))
+    msg = create_message(get_fake_msg('message'))
+    spooled = SpooledPayload('{"n": 3}')
+    spooled.spool_id = 1
+    post = mock.Mock(side_effect=requests.exceptions.ConnectionError())
+    queue = create_queue(post, maxsize=1)
+    with mock.patch('resultsdbupdater.deadletter.DEAD_LETTERS', store):
+        queue.submit(msg, '{"n": 1}')
+        queue.submit(msg, '{"n": 2}')
+        queue.submit(msg, spooled)
+
+    assert len(queue) == 1
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['RetryQueueFullError']
+    assert [record['payload'] for record in store.load(entries[0][2])] == ['{"n": 2}']
+
+
+def test_retry_stop_stores_waiting_results(tmp_path):
+    store = DeadLetterStore(str(tmp_path))
+    msg = create_message(get_fake_msg('message'))
+    spooled = SpooledPayload('{"n": 2}')
+    spooled.spool_id = 1
+    post = mock.Mock(side_effect=requests.exceptions.ConnectionError())
+    queue = create_queue(post, backoff_factor=60, max_backoff=60)
+    queue.start()
+    queue.submit(msg, '{"n": 1}')
+    queue.submit(msg, spooled)
+
+    with mock.patch('resultsdbupdater.deadletter.DEAD_LETTERS', store), \
+            mock.patch.object(msg, 'log') as log:
+        queue.stop()
+
+    assert len(queue) == 0
+    assert [call[0][1] for call in log.error.call_args_list] == ['{"n": 1}', '{"n": 2}']
+    entries = store.find()
+    assert [entry[0] for entry in entries] == ['RetryQueueStoppedError']
+    assert [record['payload'] for record in store.load(entries[0][2])] == ['{"n": 1}']
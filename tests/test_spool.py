@@ -0,0 +1,171 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import mock
+import pytest
+import requests
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import exceptions, utils
+from resultsdbupdater.spool import Spool
+
+from .conftest import FakeHub
+from .test_consumer import get_fake_msg
+
+
+def open_spool(directory, **kwargs):
+    kwargs.setdefault('segment_size', 1024 * 1024)
+    kwargs.setdefault('max_segments', 4)
+    kwargs.setdefault('fsync_interval', 0)
+    return Spool(str(directory), **kwargs)
+
+
+def segments(directory):
+    return sorted(os.listdir(str(directory)))
+
+
+def test_spool_pending_after_restart(tmp_path):
+    spool = open_spool(tmp_path)
+    payloads = [spool.append('msg-{0}'.format(i), '{"n": %s}' % i) for i in range(3)]
+    spool.done(payloads[1])
+    spool.close()
+
+    spool = open_spool(tmp_path)
+    assert spool.pending() == [('msg-0', '{"n": 0}'), ('msg-2', '{"n": 2}')]
+    assert len(spool) == 2
+
+    for _, payload in spool.pending():
+        spool.done(payload)
+    spool.close()
+
+    spool = open_spool(tmp_path)
+    assert spool.pending() == []
+
+
+def test_spool_ignores_incomplete_record(tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append('msg', '{}')
+    spool.close()
+    with open(os.path.join(str(tmp_path), segments(tmp_path)[-1]), 'a') as f:
+        f.write('{"id": 2, "msg_id": "msg", "pay')
+
+    spool = open_spool(tmp_path)
+    assert spool.pending() == [('msg', '{}')]
+    # The incomplete record was never stored
+    assert spool.append('msg', '{}').spool_id == 2
+
+
+def test_spool_removes_done_segments(tmp_path):
+    spool = open_spool(tmp_path, segment_size=100, max_segments=10)
+    first = spool.append('msg', 'x' * 100)
+    first_segment = segments(tmp_path)[0]
+    for _ in range(3):
+        spool.done(spool.append('msg', 'y' * 100))
+
+    # Oldest segment is kept as long as it has pending results
+    assert segments(tmp_path)[0] == first_segment
+    assert len(segments(tmp_path)) > 2
+
+    spool.done(first)
+    assert len(segments(tmp_path)) == 1
+    spool.close()
+
+    assert open_spool(tmp_path).pending() == []
+
+
+def test_spool_compacts_segments(tmp_path):
+    spool = open_spool(tmp_path, segment_size=100, max_segments=2)
+    spool.append('msg-1', 'x' * 100)
+    for _ in range(5):
+        spool.done(spool.append('msg-2', 'y' * 100))
+
+    assert len(segments(tmp_path)) <= 3
+    spool.close()
+
+    spool = open_spool(tmp_path, segment_size=100, max_segments=2)
+    assert spool.pending() == [('msg-1', 'x' * 100)]
+
+
+def test_spool_non_ascii_with_c_locale(tmp_path):
+    script = """
+import sys
+from resultsdbupdater.deadletter import DeadLetterStore
+from resultsdbupdater.message import create_message
+from resultsdbupdater.spool import Spool
+spool = Spool(sys.argv[1], 1024, 4, 0)
+spool.append('msg', '{"note": "\\u0159"}')
+spool.close()
+print(Spool(sys.argv[1], 1024, 4, 0).pending()[0][1])
+store = DeadLetterStore(sys.argv[2])
+msg = create_message({'headers': {'message-id': 'msg'}, 'body': {'msg': {'note': '\\u0159'}}})
+store.store(msg, RuntimeError('\\u0159'))
+print(store.load(store.find()[0][2])[0]['message']['body']['msg']['note'])
+"""
+    env = dict(os.environ, LC_ALL='C', PYTHONUTF8='0', PYTHONIOENCODING='utf-8')
+    output = subprocess.check_output(
+        [sys.executable, '-c', script, str(tmp_path / 'spool'), str(tmp_path / 'dead')],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.decode('utf-8').splitlines() == ['{"note": "\u0159"}', '\u0159']
+
+
+def test_spool_syncs_after_interval(tmp_path):
+    synced = threading.Event()
+    now = [0.0]
+    spool = open_spool(tmp_path, fsync_interval=0.05, timer=lambda: now[0])
+    with mock.patch('os.fsync', side_effect=lambda fd: synced.set()) as fsync:
+        spool.append('msg', '{}')
+        spool.append('msg', '{}')
+        assert not fsync.called
+
+        # Synced by timer although nothing else is written
+        now[0] = 0.05
+        assert synced.wait(5)
+        assert fsync.call_count == 1
+
+        spool.close()
+        assert fsync.call_count == 2
+    assert spool._sync_timer is None
+
+
+@pytest.mark.parametrize(('error', 'done'), [
+    (None, True),
+    (exceptions.CreateResultError('Bad request', '{}'), True),
+    (requests.exceptions.ConnectionError(), False),
+])
+def test_spool_wrap_post(tmp_path, error, done):
+    spool = open_spool(tmp_path)
+    post = spool.wrap_post(mock.Mock(side_effect=error))
+    payload = spool.append('msg', '{}')
+
+    if error is None:
+        post(mock.Mock(), payload)
+    else:
+        with pytest.raises(type(error)):
+            post(mock.Mock(), payload)
+
+    assert len(spool) == (0 if done else 1)
+
+
+def test_consumer_replays_spool(mock_session, tmp_path):
+    spool = open_spool(tmp_path)
+    spool.append('msg-1', json.dumps({'testcase': 'replayed'}))
+    spool.close()
+
+    with mock.patch('resultsdbupdater.config.SPOOL_DIR', str(tmp_path)):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            assert mock_session.post.call_count == 1
+            assert len(consumer.spool) == 0
+
+            consumer.consume(get_fake_msg('message'))
+            assert mock_session.post.call_count == 3
+            assert len(consumer.spool) == 0
+        finally:
+            consumer.stop()
+
+    assert utils.submit_result == utils.post_result
+    assert json.loads(mock_session.post.call_args_list[0][1]['data']) == {
+        'testcase': 'replayed'}
@@ -0,0 +1,99 @@
+import asyncio
+
+import mock
+import pytest
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import metrics, timing
+
+from .conftest import FakeHub
+from .test_consumer import get_fake_msg
+
+
+@pytest.fixture
+def stages():
+    recorded = []
+
+    def hook(stage, duration, msg):
+        recorded.append((stage, duration, msg))
+
+    timing.add_hook(hook)
+    try:
+        yield recorded
+    finally:
+        timing.remove_hook(hook)
+
+
+def test_stage_without_hooks():
+    assert timing.stage(timing.STAGE_HTTP) is timing.stage(timing.STAGE_EXTRACT)
+    with timing.stage(timing.STAGE_HTTP):
+        pass
+
+
+def test_nested_stages_excluded(stages):
+    with mock.patch('time.perf_counter', side_effect=[0, 1, 4, 10]):
+        with timing.stage(timing.STAGE_EXTRACT, 'msg'):
+            with timing.stage(timing.STAGE_HTTP, 'msg'):
+                pass
+
+    assert stages == [(timing.STAGE_HTTP, 3, 'msg'), (timing.STAGE_EXTRACT, 7, 'msg')]
+
+
+def test_concurrent_tasks(stages):
+    async def handle(delay):
+        with timing.stage(timing.STAGE_EXTRACT, delay):
+            with timing.stage(timing.STAGE_HTTP, delay):
+                await asyncio.sleep(delay)
+
+    async def run():
+        await asyncio.gather(handle(0.05), handle(0.02))
+
+    asyncio.run(run())
+
+    durations = {(stage, msg): duration for stage, duration, msg in stages}
+    assert durations[(timing.STAGE_HTTP, 0.05)] >= 0.05
+    assert durations[(timing.STAGE_HTTP, 0.02)] >= 0.02
+    assert durations[(timing.STAGE_EXTRACT, 0.05)] < 0.01
+    assert durations[(timing.STAGE_EXTRACT, 0.02)] < 0.01
+
+
+def test_failing_hook(stages, caplog):
+    def failing_hook(stage, duration, msg):
+        raise RuntimeError('Hook failed')
+
+    timing.add_hook(failing_hook)
+    try:
+        with timing.stage(timing.STAGE_HTTP):
+            pass
+    finally:
+        timing.remove_hook(failing_hook)
+
+    assert len(stages) == 1
+    assert 'Timing hook' in caplog.text
+
+
+def test_load_hook():
+    assert timing.load_hook('resultsdbupdater.timing:observe_metrics') \
+        is timing.observe_metrics
+    with pytest.raises(ValueError):
+        timing.load_hook('resultsdbupdater.timing')
+
+
+def test_consumer_stages(mock_session):
+    hooks = ['resultsdbupdater.timing:observe_metrics']
+    with mock.patch('resultsdbupdater.config.TIMING_HOOKS', hooks):
+        consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            counts = {
+                stage: metrics.STAGE_DURATION.count(stage)
+                for stage in ('create_message', 'classify', 'extract', 'serialize', 'http')
+            }
+            consumer.consume(get_fake_msg('container_image_message'))
+        finally:
+            consumer.stop()
+
+    assert timing.observe_metrics not in timing._hooks
+    assert {
+        stage: metrics.STAGE_DURATION.count(stage) - count
+        for stage, count in counts.items()
+    } == dict.fromkeys(counts, 1)
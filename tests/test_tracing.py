@@ -0,0 +1,90 @@
+import json
+
+import mock
+import pytest
+
+from resultsdbupdater import consumer as ciconsumer
+from resultsdbupdater import metrics, tracing
+from resultsdbupdater.message import create_message
+
+from .conftest import FakeHub
+from .test_consumer import consumer, get_fake_msg
+
+
+@pytest.mark.parametrize('msg_data, expected', [
+    ({'headers': {'timestamp': '1547722123935'}}, 1547722123.935),
+    ({'headers': {'timestamp': 1547722123935}}, 1547722123.935),
+    ({'headers': {'timestamp': '0'}, 'timestamp': 1573398038.0}, 1573398038.0),
+    ({'headers': {}, 'timestamp': 1573398038.0}, 1573398038.0),
+    ({'headers': {'timestamp': 'bad'}}, None),
+    ({'headers': {'timestamp': '0'}}, None),
+    ({}, None),
+])
+def test_publish_time(msg_data, expected):
+    msg = create_message(dict(msg_data, body={}))
+    assert tracing.publish_time(msg) == expected
+
+
+def test_trace_records_consumer_lag():
+    msg = create_message(get_fake_msg('container_image_message'))
+    count = metrics.CONSUMER_LAG.count()
+
+    with mock.patch('time.time', return_value=1547722125.0):
+        with tracing.trace(msg) as msg_trace:
+            assert msg.trace is msg_trace
+
+    assert msg_trace.trace_id == msg.msg_id
+    assert msg_trace.received - msg_trace.published == pytest.approx(1.065)
+    assert metrics.CONSUMER_LAG.count() == count + 1
+
+
+def test_result_accepted_without_trace():
+    msg = create_message(get_fake_msg('container_image_message'))
+    count = metrics.RESULT_LATENCY.count()
+    tracing.result_accepted(msg, 0)
+    assert metrics.RESULT_LATENCY.count() == count
+
+
+def test_consumer_exports_spans(mock_session, tmp_path):
+    trace_file = tmp_path / 'spans.jsonl'
+    with mock.patch('resultsdbupdater.config.TRACE_FILE', str(trace_file)):
+        mock_session.post.return_value.status_code = 201
+        traced_consumer = ciconsumer.CIConsumer(FakeHub())
+        try:
+            count = metrics.RESULT_LATENCY.count()
+            fake_msg = get_fake_msg('container_image_message')
+            traced_consumer.consume(fake_msg)
+        finally:
+            traced_consumer.stop()
+
+    assert tracing.span_exporter is None
+    assert metrics.RESULT_LATENCY.count() == count + 1
+
+    with open(str(trace_file)) as f:
+        spans = [json.loads(line) for line in f]
+
+    assert [span['name'] for span in spans] == ['create_result', 'queue', 'consume']
+    result, queue, consume = spans
+    msg_id = fake_msg['headers']['message-id']
+    assert {span['trace_id'] for span in spans} == {msg_id}
+    assert result['parent_span_id'] == consume['span_id']
+    assert queue['parent_span_id'] is None
+    assert queue['start_time'] == 1547722123.935
+    assert queue['end_time'] == consume['start_time']
+    assert consume['attributes'] == {'topic': fake_msg['topic'], 'error': None}
+    assert result['attributes']['latency'] >= 0
+
+
+def test_consumer_exports_failed_span(tmp_path):
+    exporter = tracing.SpanFileExporter(str(tmp_path / 'spans.jsonl'))
+    fake_msg = get_fake_msg('redhat_module_message')
+    fake_msg['body']['msg']['artifact']['nsvc'] = 'BAD_FORMAT'
+    with mock.patch('resultsdbupdater.tracing.span_exporter', exporter):
+        consumer.consume(fake_msg)
+    exporter.close()
+
+    with open(exporter.path) as f:
+        spans = [json.loads(line) for line in f]
+
+    assert spans[-1]['name'] == 'consume'
+    assert spans[-1]['attributes']['error'] == 'InvalidMessageError'
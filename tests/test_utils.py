@@ -1,6 +1,7 @@
 import mock
 import pytest
 import re
+import threading
 import requests
 import requests_mock
 
@@ -29,6 +30,29 @@ def test_namespace_from_topic(topic, namespace):
     assert utils.namespace_from_topic(topic) == namespace
 
 
+@pytest.mark.parametrize(
+    ('topic', 'expected'),
+    [
+        (
+            '/topic/VirtualTopic.eng.ci.rhproduct.brew-build.test.error',
+            utils.TopicInfo('rhproduct', 'brew-build', 'test', 'error', 'ERROR'),
+        ),
+        (
+            '/topic/VirtualTopic.eng.ci.rhproduct.brew-build.test.complete',
+            utils.TopicInfo('rhproduct', 'brew-build', 'test', 'complete', None),
+        ),
+        (
+            '/topic/VirtualTopic.eng.ci.brew-build.test.running',
+            utils.TopicInfo(None, None, None, 'running', 'RUNNING'),
+        ),
+        ('queued', utils.TopicInfo(None, None, None, None, None)),
+    ]
+)
+def test_parse_topic(topic, expected):
+    assert utils.parse_topic(topic) == expected
+    assert utils.parse_topic(topic) is utils.parse_topic(topic)
+
+
 def test_verify_topic_and_testcase_name():
     topic = '/topic/VirtualTopic.eng.ci.rhproduct.brew-build.test.complete'
     testcase = 'rhproduct.default.functional'
@@ -82,6 +106,26 @@ def test_verify_private_testcase_mismatch():
         utils.verify_private_testcase(bad_msg_publisher_id, 'prodsec.test')
 
 
+@pytest.mark.parametrize(('testcase_name', 'expected'), [
+    ('public.functional', ()),
+    ('prodsec.test', (('prodsec.*', 'a'), ('*.test', 'b'))),
+    ('prodsec', ()),
+    ('other.test', (('*.test', 'b'),)),
+    ('other.test.x', ()),
+])
+def test_private_testcase_matcher(testcase_name, expected):
+    matcher = utils.PrivateTestCaseMatcher((
+        ('prodsec.*', 'a'),
+        ('*.test', 'b'),
+        ('[!a-z]*', 'c'),
+    ))
+    assert matcher.matching(testcase_name) == expected
+
+
+def test_private_testcase_matcher_empty():
+    assert utils.PrivateTestCaseMatcher(()).matching('prodsec.test') == ()
+
+
 def test_string_too_large():
     """
     Large values cannot be stored in ResultsDB in a DB index.
@@ -91,9 +135,8 @@ def test_string_too_large():
 
     JIRA: FACTORY-5780
     """
-    data = {'reason': 'x' * 8193}
     log = mock.Mock()
-    utils.crop_data(log, data)
+    data = utils.serialize_data(log, {'reason': 'x' * 8193})
     assert len(data['reason']) == 8192
     assert data['reason'].endswith('x...')
     log.warning.assert_called_with('Cropping large value for field %s', 'reason')
@@ -101,33 +144,120 @@ def test_string_too_large():
 
 def test_dict_too_large():
     """
-    Raises an exception if the dict data is too large.
+    Crops large dict data serialized to JSON.
 
     JIRA: RHELWF-558
     """
     data = {'artifact': {'x': 'x' * 8192}}
     log = mock.Mock()
+    data = utils.serialize_data(log, data)
+    assert data == {'artifact': '{"x": "' + 'x' * 8182 + '...'}
+    log.warning.assert_called_with('Cropping large value for field %s', 'artifact')
+
+
+def test_value_too_large():
+    """
+    Raises an exception if non-string value is too large.
+    """
+    data = {'artifact': ('x' * 8192,)}
     message = 'Result value "artifact" is too large'
     with pytest.raises(exceptions.InvalidMessageError, match=message):
-        utils.crop_data(log, data)
+        utils.serialize_data(mock.Mock(), data)
 
 
 def test_list_too_large():
     """
-    Raises an exception if the dict data is too large.
+    Crops large items in lists individually.
 
     JIRA: RHELWF-558
     """
     data = {'artifact': ['x', 'x' * 8192]}
     log = mock.Mock()
-    utils.crop_data(log, data)
-    assert data == {'artifact': ['x', 'x' * 8192]}
+    assert utils.serialize_data(log, data) == data
+    log.warning.assert_not_called()
 
-    data = {'artifact': ['x', 'x' * 8193]}
-    log = mock.Mock()
-    message = 'Result value "artifact" contains items that are too large'
-    with pytest.raises(exceptions.InvalidMessageError, match=message):
-        utils.crop_data(log, data)
+    items = ['x', 'x' * 8193, ['y' * 8193]]
+    data = utils.serialize_data(log, {'artifact': items})
+    assert data == {'artifact': ['x', 'x' * 8189 + '...', str(['y' * 8193])[:8189] + '...']}
+    assert items[1] == 'x' * 8193
+    log.warning.assert_called_with('Cropping large value for field %s', 'artifact')
+
+
+@pytest.mark.parametrize(('text', 'expected'), [
+    # 2 bytes per character
+    ('\u0159' * 4096, '\u0159' * 4096),
+    ('\u0159' * 4097, '\u0159' * 4094 + '...'),
+    # Partial character is dropped
+    ('x' + '\u0159' * 4096, 'x' + '\u0159' * 4094 + '...'),
+])
+def test_crop_utf8(text, expected):
+    data = utils.serialize_data(mock.Mock(), {'reason': text})
+    assert data == {'reason': expected}
+    assert len(data['reason'].encode('utf-8')) <= 8192
+
+
+@pytest.mark.parametrize(('text', 'cropped'), [
+    ('x' * 10000, 10000 - 8192),
+    # 2 bytes per character
+    ('\u0159' * 10000, 20000 - (4094 * 2 + 3)),
+])
+def test_cropped_bytes_metric(text, cropped):
+    with mock.patch('resultsdbupdater.metrics.CROPPED_BYTES.inc') as inc:
+        utils.serialize_data(mock.Mock(), {'reason': text})
+    inc.assert_called_once_with(amount=cropped)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('\ud800', '\ud800'),
+    (['\ud800x'], ['\ud800x']),
+    ('\ud800' * 3000, '\ud800' * 2729 + '...'),
+    ('x' * 8189 + '\ud800' * 2, 'x' * 8189 + '...'),
+])
+def test_serialize_lone_surrogates(value, expected):
+    with mock.patch('resultsdbupdater.metrics.CROPPED_BYTES.inc') as inc:
+        serialized = utils.serialize_data(mock.Mock(), {'reason': value})
+    assert serialized == {'reason': expected}
+    if isinstance(expected, str) and expected.endswith('...'):
+        inc.assert_called_once()
+
+
+@pytest.mark.parametrize(('data', 'expected'), [
+    (
+        {'reason': 'x' * 8193, 'short': 'x', 'number': 1, 'none': None},
+        {'reason': 'x' * 8189 + '...', 'short': 'x', 'number': 1, 'none': None},
+    ),
+    (
+        {'artifact': {'x': 'x' * 8192}, 'nested': {'a': [1, {'b': 2}]}},
+        {'artifact': '{"x": "' + 'x' * 8182 + '...', 'nested': '{"a": [1, {"b": 2}]}'},
+    ),
+    (
+        {'builds': [{'nvr': 'a-1-1'}, 'x' * 8192, 3, None]},
+        {'builds': ['{"nvr": "a-1-1"}', 'x' * 8192, 3, None]},
+    ),
+])
+def test_serialize_data(data, expected):
+    assert utils.serialize_data(mock.Mock(), data) == expected
+
+
+def test_serialize_data_crops_list_items():
+    data = {'builds': [{'nvr': 'x' * 8192}, 'x' * 8193, 'x']}
+    serialized = utils.serialize_data(mock.Mock(), data)
+    assert serialized == {'builds': [
+        '{"nvr": "' + 'x' * 8180 + '...',
+        'x' * 8189 + '...',
+        'x',
+    ]}
+
+
+@pytest.mark.parametrize(('data', 'outcome', 'expected'), [
+    ({'type': 'brew-build'}, 'PASSED', ('brew-build', 'PASSED')),
+    ({'type': 'koji_build_scratch'}, 'FAILED', ('koji_build_scratch', 'FAILED')),
+    ({}, 'NEEDS_INSPECTION', ('unknown', 'NEEDS_INSPECTION')),
+    ({'type': 'made-up-type'}, 'MADE_UP', ('other', 'other')),
+    ({'type': ['brew-build']}, None, ('other', 'other')),
+])
+def test_result_metric_labels(data, outcome, expected):
+    assert utils.result_metric_labels(data, outcome) == expected
 
 
 @pytest.mark.parametrize(
@@ -141,6 +271,86 @@ def test_create_results_failure(status_code, exception, message):
     url = '{0}/results'.format(utils.config.RESULTSDB_API_URL)
     with requests_mock.Mocker() as mocked_requests:
         mocked_requests.post(url, json={'message': message}, status_code=status_code)
-        msg = mock.Mock()
+        msg = mock.Mock(trace=None)
         with pytest.raises(exception, match=message):
             utils.create_result(msg, 'testcase', 'PASSED', 'http://example.com', {})
+
+
+@pytest.mark.parametrize('max_in_flight', (1, 4))
+def test_result_batch_submit(max_in_flight):
+    msg = mock.Mock(trace=None)
+    with mock.patch('resultsdbupdater.utils.session') as mock_session, \
+            mock.patch('resultsdbupdater.config.BATCH_MAX_IN_FLIGHT', max_in_flight):
+        batch = utils.ResultBatch(msg)
+        for i in range(5):
+            utils.create_result(msg, 'testcase.{0}'.format(i), 'PASSED', '', {}, batch=batch)
+        mock_session.post.assert_not_called()
+
+        batch.submit()
+
+    assert mock_session.post.call_count == 5
+    assert batch.payloads == []
+
+
+def test_result_batch_submit_failure():
+    msg = mock.Mock(trace=None)
+    error = requests.exceptions.Timeout()
+    with mock.patch('resultsdbupdater.utils.session') as mock_session, \
+            mock.patch('resultsdbupdater.config.BATCH_MAX_IN_FLIGHT', 4):
+        mock_session.post.side_effect = [mock.Mock(status_code=201), error, error]
+        batch = utils.ResultBatch(msg)
+        for i in range(3):
+            batch.add('{}')
+
+        with pytest.raises(requests.exceptions.Timeout):
+            batch.submit()
+
+    assert mock_session.post.call_count == 3
+
+
+def test_result_batch_not_submitted_on_invalid_result():
+    msg = mock.Mock(trace=None)
+    msg.header.return_value = 'msg-producer-bad'
+    with mock.patch('resultsdbupdater.utils.session') as mock_session:
+        batch = utils.ResultBatch(msg)
+        utils.create_result(msg, 'public.test', 'PASSED', '', {}, batch=batch)
+        with pytest.raises(exceptions.PrivateTestCaseMismatchError):
+            utils.create_result(msg, 'prodsec.test', 'PASSED', '', {}, batch=batch)
+
+    mock_session.post.assert_not_called()
+
+
+def test_get_or_create_group_uuid_concurrent():
+    """
+    Concurrent lookups for the same group share single GET request and
+    generated UUID.
+    """
+    utils.GROUP_CACHE.clear()
+    utils.GROUP_LOOKUPS.shared = 0
+    release = threading.Event()
+    uuids = []
+
+    def get(*args, **kwargs):
+        release.wait()
+        return mock.Mock(**{'json.return_value': {'data': []}})
+
+    def lookup():
+        uuids.append(utils.get_or_create_group_uuid('https://example.com/run/1'))
+
+    with mock.patch('resultsdbupdater.utils.session') as mock_session, \
+            mock.patch('resultsdbupdater.utils.uuid.uuid4', side_effect=range(100)):
+        mock_session.get.side_effect = get
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while utils.GROUP_LOOKUPS.shared < 3:
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # Following lookups use the cached group
+        lookup()
+
+    mock_session.get.assert_called_once()
+    assert uuids == ['0'] * 5